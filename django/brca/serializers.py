@@ -0,0 +1,83 @@
+"""
+JSON encoding for the API responses.
+
+The encoder is the first one of settings.JSON_ENCODERS that is installed. ujson (1.35, the last
+release for Python 2) is much faster than the json module on the large variant listings.
+
+ujson writes dates as timestamps instead of the ISO strings of DjangoJSONEncoder, so responses
+are expected to hold only strings, numbers, booleans, None, lists and dicts. Pass anything else,
+such as the values() of a model with date fields, through jsonable() first.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+JSON_TYPES = (basestring, int, long, float, bool, type(None))
+
+
+def jsonable(data):
+    """data with the values the json module can't encode (dates, decimals) turned into what
+    DjangoJSONEncoder writes for them"""
+    if isinstance(data, dict):
+        return {key: jsonable(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [jsonable(value) for value in data]
+    if isinstance(data, JSON_TYPES):
+        return data
+    return DjangoJSONEncoder().default(data)
+
+
+def json_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def ujson_dumps(data):
+    import ujson
+    # 15 digits is ujson's most precise, its default of 9 would round the floats
+    return ujson.dumps(data, ensure_ascii=False, double_precision=15)
+
+
+ENCODERS = {
+    'ujson': ujson_dumps,
+    'json': json_dumps,
+}
+
+
+def select_encoder(names):
+    """The first of the named encoders that is installed"""
+    for name in names:
+        try:
+            ENCODERS[name]({'check': [1, 'a', None]})
+        except ImportError:
+            continue
+        return name, ENCODERS[name]
+    return 'json', json_dumps
+
+
+encoder_name, fast_dumps = select_encoder(getattr(settings, 'JSON_ENCODERS', ('ujson', 'json')))
+
+
+def dumps(data):
+    """Encode data as JSON bytes"""
+    try:
+        content = fast_dumps(data)
+    except (TypeError, ValueError, OverflowError):
+        # anything the fast encoder rejects gets the same treatment as with django's encoder
+        content = json_dumps(data)
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return content
+
+
+class JsonResponse(HttpResponse):
+    """Drop-in for django.http.JsonResponse that encodes with the selected encoder,
+    data must already be jsonable (see above)"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False')
+        kwargs.setdefault('content_type', 'application/json')
+        super(JsonResponse, self).__init__(content=dumps(data), **kwargs)
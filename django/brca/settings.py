@@ -108,6 +108,64 @@ DATABASES = {
     }
 }
 
+# Caches
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# Counts and other results derived from the variant data are versioned by data release,
+# use a shared backend (memcached, redis) to share them between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # whole responses of the variant listing
+    'responses': {
+        'BACKEND': 'data.caching.LRUCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+    # whole responses of the lollipop chart, a few per gene
+    'lollipop': {
+        'BACKEND': 'data.caching.LRUCache',
+        'LOCATION': 'lollipop',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50,
+        },
+    },
+}
+
+# The largest response in bytes each response cache keeps, with MAX_ENTRIES this bounds their memory.
+# Larger ones, like big pages of the variant listing, are built again on every request.
+CACHED_RESPONSE_MAX_BYTES = {
+    'responses': 256 * 1024,
+    'lollipop': 4 * 1024 * 1024,
+}
+
+# Set REDIS_URL to share the cached responses between workers through a local redis (needs django-redis)
+if os.environ.get('REDIS_URL'):
+    CACHES['responses'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'TIMEOUT': None,
+    }
+
+# Seconds between checks for a newly loaded data release
+DATA_RELEASE_TTL = 60
+
+# Answer autocomplete suggestions from a per-worker copy of the words table instead of querying it
+SUGGESTIONS_IN_MEMORY = True
+
+# Full exports read the variants in bounded batches: unpaged JSON and GA4GH searches through server-side cursors,
+# this many rows per fetch, CSV through COPY, its rows are sent on in chunks of about this many bytes
+EXPORT_FETCH_SIZE = 2000
+EXPORT_COPY_CHUNK_SIZE = 64 * 1024
+
+# JSON encoders for the API responses in order of preference, the first installed one is used (see brca/serializers.py)
+JSON_ENCODERS = ('ujson', 'json')
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -5,3 +5,7 @@ from django.apps import AppConfig
 
 class DataConfig(AppConfig):
     name = 'data'
+
+    def ready(self):
+        # the views build the GA4GH variant set responses on import, do it before the first request
+        from . import views
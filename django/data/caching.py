@@ -0,0 +1,138 @@
+import hashlib
+import json
+from collections import OrderedDict
+from functools import wraps
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends import locmem
+from django.http import HttpResponse
+
+from .models import DataRelease
+
+RELEASE_KEY = 'data_release'
+
+
+def latest_release():
+    # The latest release is looked up in the database at most once every DATA_RELEASE_TTL seconds,
+    # returns its id and when it was loaded
+    release = cache.get(RELEASE_KEY)
+    if release is None:
+        latest = DataRelease.objects.order_by('-id').first()
+        release = (latest.id, latest.loaded_at) if latest else (0, None)
+        cache.set(RELEASE_KEY, release, settings.DATA_RELEASE_TTL)
+    return release
+
+
+def current_release():
+    # everything cached from the variant data is stored under the release id as its version
+    return latest_release()[0]
+
+
+def new_release(**changes):
+    # call after reloading the variant table, entries cached for older releases are never read again
+    release = DataRelease.objects.create(**changes)
+    cache.delete(RELEASE_KEY)
+    return release
+
+
+def cache_key(prefix, params):
+    # hash the parameters so arbitrary search terms still make valid memcached keys
+    return '{}:{}'.format(prefix, hashlib.md5(json.dumps(params, sort_keys=True)).hexdigest())
+
+
+def cached(prefix, params, compute, timeout=None):
+    key = cache_key(prefix, params)
+    release = current_release()
+    value = cache.get(key, version=release)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout, version=release)
+    return value
+
+
+def release_etag(request, *args, **kwargs):
+    # The variant data only changes with a release, so the release and the normalized request identify
+    # the response body. Compressed and uncompressed bodies get different tags, and so do the content
+    # types negotiated from Accept (JSON or protobuf on the GA4GH views).
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return cache_key('etag', [current_release(), request.path, normalized_query(request.GET), gzipped, accept])
+
+
+def release_last_modified(request, *args, **kwargs):
+    return latest_release()[1]
+
+
+class LRUCache(locmem.LocMemCache):
+    """LocMemCache that drops the least recently used entries when it reaches MAX_ENTRIES"""
+
+    def __init__(self, name, params):
+        super(LRUCache, self).__init__(name, params)
+        if not isinstance(self._cache, OrderedDict):
+            self._cache = locmem._caches[name] = OrderedDict(self._cache)
+
+    def get(self, key, default=None, version=None):
+        value = super(LRUCache, self).get(key, default, version)
+        key = self.make_key(key, version=version)
+        with self._lock.writer():
+            if key in self._cache:
+                self._cache[key] = self._cache.pop(key)
+        return value
+
+    def _cull(self):
+        if self._cull_frequency == 0:
+            self._cache.clear()
+            self._expire_info.clear()
+        else:
+            for key in list(islice(self._cache, max(1, len(self._cache) // self._cull_frequency))):
+                self._delete(key)
+
+
+# Parameters whose order doesn't change the response, filters and their values are matched up by position.
+# The column order does matter in the columns layout.
+UNORDERED_PARAMETERS = ('include', 'exclude', 'column')
+
+
+def normalized_query(query_dict):
+    params = {key: query_dict.getlist(key) for key in query_dict}
+    for key in UNORDERED_PARAMETERS:
+        if key in params and not (key == 'column' and query_dict.get('layout') == 'columns'):
+            params[key] = sorted(params[key])
+    # range filters take their bounds from filterMin and filterMax by position, those queries are kept as they are
+    if 'filterMin' not in params and 'filterMax' not in params:
+        params.pop('filterValue', None)
+        params['filter'] = sorted(zip(query_dict.getlist('filter'), query_dict.getlist('filterValue')))
+    return params
+
+
+def cached_response(view=None, cache_alias='responses'):
+    """Serve repeated queries from the cache_alias cache, keyed by the normalized GET parameters
+    and versioned by data release. Only complete 200 responses are stored, not streamed ones,
+    and not the ones larger than the CACHED_RESPONSE_MAX_BYTES of the cache.
+    Use as @cached_response, or as @cached_response(cache_alias=...) to keep a view's responses apart."""
+    if view is None:
+        return lambda view: cached_response(view, cache_alias)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        responses = caches[cache_alias]
+        key = cache_key(view.__name__, normalized_query(request.GET))
+        release = current_release()
+
+        cached = responses.get(key, version=release)
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            return response
+
+        response = view(request, *args, **kwargs)
+        max_bytes = settings.CACHED_RESPONSE_MAX_BYTES.get(cache_alias)
+        if response.status_code == 200 and not response.streaming and (
+                max_bytes is None or len(response.content) <= max_bytes):
+            responses.set(key, (response.content, response.items()), None, version=release)
+        return response
+    return wrapper
@@ -0,0 +1,409 @@
+import csv
+import re
+import time
+from cStringIO import StringIO
+
+from django.db import connection, transaction, OperationalError
+
+# Data sources that get a Variant_in_<source> flag, derived from the comma separated Source column
+SOURCES = ('ENIGMA', 'ClinVar', '1000_Genomes', 'ExAC', 'LOVD', 'BIC', 'ESP', 'exLOVD')
+
+# The columns making up the search documents, in the order of 0002_search_index
+STANDARD_COLUMNS = (
+    'Source', 'URL_ENIGMA', 'Condition_ID_type_ENIGMA', 'Condition_ID_value_ENIGMA', 'Condition_category_ENIGMA',
+    'Clinical_significance_ENIGMA', 'Date_last_evaluated_ENIGMA', 'Assertion_method_ENIGMA',
+    'Assertion_method_citation_ENIGMA', 'Clinical_significance_citations_ENIGMA',
+    'Comment_on_clinical_significance_ENIGMA', 'Collection_method_ENIGMA', 'Allele_origin_ENIGMA',
+    'ClinVarAccession_ENIGMA', 'Clinical_Significance_ClinVar', 'Date_Last_Updated_ClinVar', 'Submitter_ClinVar',
+    'SCV_ClinVar', 'Allele_Origin_ClinVar', 'Method_ClinVar', 'Functional_analysis_result_LOVD',
+    'Origin_of_variant_LOVD', 'Functional_analysis_technique_LOVD', 'Variant_frequency_LOVD',
+    'Variant_haplotype_LOVD', 'Minor_allele_frequency_ESP', 'EUR_Allele_frequency_1000_Genomes',
+    'AFR_Allele_frequency_1000_Genomes', 'AMR_Allele_frequency_1000_Genomes', 'EAS_Allele_frequency_1000_Genomes',
+    'Allele_frequency_1000_Genomes', 'SAS_Allele_frequency_1000_Genomes', 'Allele_frequency_ExAC',
+    'Patient_nationality_BIC', 'Clinical_importance_BIC', 'Clinical_classification_BIC', 'Literature_citation_BIC',
+    'Number_of_family_member_carrying_mutation_BIC', 'Germline_or_Somatic_BIC', 'Ethnicity_BIC',
+    'Mutation_type_BIC', 'IARC_class_exLOVD', 'Sum_family_LR_exLOVD', 'Combined_prior_probablility_exLOVD',
+    'Literature_source_exLOVD', 'Co_occurrence_LR_exLOVD', 'Posterior_probability_exLOVD',
+    'Missense_analysis_prior_probability_exLOVD', 'Segregation_LR_exLOVD', 'SIFT_VEP', 'PolyPhen_VEP',
+    'Gene_Symbol', 'Reference_Sequence', 'HGVS_cDNA', 'BIC_Identifier', 'HGVS_Protein', 'Protein_Change',
+    'Allele_Frequency', 'Max_Allele_Frequency', 'Genomic_Coordinate_hg38', 'Source_URL', 'Discordant',
+    'Pathogenicity_default', 'Pathogenicity_research')
+SYNONYM_COLUMNS = ('Genomic_Coordinate_hg37', 'Genomic_Coordinate_hg36', 'Synonyms')
+
+
+def column_list(columns, row=None):
+    return ', '.join((row + '.' if row else '') + '"{}"'.format(column) for column in columns)
+
+
+def tsvector_sql(columns, row=None):
+    return "to_tsvector('pg_catalog.simple', concat_ws(' ', {}))".format(column_list(columns, row))
+
+
+# Fills both search documents of every written row, building the standard document once
+SEARCH_TRIGGER_FUNCTION = """
+    CREATE OR REPLACE FUNCTION variant_fts_trigger() RETURNS TRIGGER AS $$
+    DECLARE
+        standard tsvector;
+    BEGIN
+        standard := {};
+        NEW.fts_standard := standard;
+        NEW.fts_document := standard || {};
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """.format(tsvector_sql(STANDARD_COLUMNS, row='NEW'), tsvector_sql(SYNONYM_COLUMNS, row='NEW'))
+
+
+# Frequency columns with a parsed copy, "<column>_numeric", for range filters (see 0011_frequency_columns)
+FREQUENCY_COLUMNS = (
+    'Allele_Frequency', 'Max_Allele_Frequency', 'Allele_frequency_ExAC', 'Minor_allele_frequency_ESP',
+    'Allele_frequency_1000_Genomes', 'AFR_Allele_frequency_1000_Genomes', 'AMR_Allele_frequency_1000_Genomes',
+    'EAS_Allele_frequency_1000_Genomes', 'EUR_Allele_frequency_1000_Genomes', 'SAS_Allele_frequency_1000_Genomes')
+
+
+def numeric_column(column):
+    return column + '_numeric'
+
+
+def frequency_sql(column, row=None):
+    # the leading number of the text, 0.498 for "0.498000 (SAS from 1000 Genomes)" and NULL for "-"
+    return r"""substring({} from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision""".format(
+        column_list([column], row))
+
+
+# Fills the numeric copies of the frequency columns of every written row
+FREQUENCY_TRIGGER_FUNCTION = """
+    CREATE OR REPLACE FUNCTION variant_frequency_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        {}
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """.format('\n        '.join('NEW."{}" := {};'.format(numeric_column(column), frequency_sql(column, row='NEW'))
+                                for column in FREQUENCY_COLUMNS))
+
+FREQUENCIES_SQL = "({}) = ({})".format(
+    column_list(numeric_column(column) for column in FREQUENCY_COLUMNS),
+    ', '.join(frequency_sql(column) for column in FREQUENCY_COLUMNS))
+
+
+# Genomic coordinates like "chr17:41276045:A>G" are parsed into chromosome, position, reference and alternate
+# bases columns per assembly for region searches (see 0012_coordinate_columns)
+ASSEMBLIES = ('hg36', 'hg37', 'hg38')
+COORDINATE_PATTERN = r'(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$'
+
+
+def coordinate_columns(assembly):
+    return ['Chromosome_' + assembly, 'Position_' + assembly, 'Ref_' + assembly, 'Alt_' + assembly]
+
+
+def coordinate_sql(assembly, row=None):
+    # no row, and so NULL in every column, when the coordinate doesn't parse
+    return "SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches({}, '{}') AS m".format(
+        column_list(['Genomic_Coordinate_' + assembly], row), COORDINATE_PATTERN)
+
+
+COORDINATES_SQL = ', '.join(
+    '({}) = ({})'.format(column_list(coordinate_columns(assembly)), coordinate_sql(assembly))
+    for assembly in ASSEMBLIES)
+
+# Fills the parsed coordinate columns of every written row
+COORDINATES_TRIGGER_FUNCTION = """
+    CREATE OR REPLACE FUNCTION variant_coordinates_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+        {}
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """.format('\n        '.join(
+        '{} INTO {};'.format(coordinate_sql(assembly, row='NEW'), column_list(coordinate_columns(assembly), 'NEW'))
+        for assembly in ASSEMBLIES))
+
+
+# Each row's standard search document is built once for both documents
+SEARCH_DOCUMENTS_SQL = """(fts_standard, fts_document) = (
+    SELECT standard, standard || synonyms FROM (SELECT {} AS standard, {} AS synonyms) AS documents)""".format(
+    tsvector_sql(STANDARD_COLUMNS), tsvector_sql(SYNONYM_COLUMNS))
+
+# Every column the triggers derive, as the SET list of a single set-based UPDATE
+DERIVED_COLUMNS_SQL = ', '.join([SEARCH_DOCUMENTS_SQL, FREQUENCIES_SQL, COORDINATES_SQL])
+
+
+class IteratorFile(object):
+    # file-like object for copy_expert that reads from an iterator of strings
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def read_variants(tsv_file):
+    # yields the header, then each row as a list with the Variant_in_<source> flags appended
+    reader = csv.reader(tsv_file, dialect="excel-tab")
+    header = reader.next()
+    source_index = header.index('Source')
+    yield header + ['Variant_in_' + source for source in SOURCES]
+
+    for row in reader:
+        sources = row[source_index].split(',')
+        yield row + [source in sources for source in SOURCES]
+
+
+def csv_lines(rows):
+    # every field is quoted so that empty strings aren't read back as NULL
+    buffer = StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def copy_variants(cursor, tsv_file, table='variant'):
+    """Stream the variants in tsv_file into table with COPY, returns the loaded columns and number of rows"""
+    rows = read_variants(tsv_file)
+    header = rows.next()
+    cursor.copy_expert(
+        "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table, column_list(header)),
+        IteratorFile(csv_lines(rows)))
+    return header, cursor.rowcount
+
+
+def bulk_load(cursor, tsv_file, table='variant', keep_ids=False):
+    """Append the variants in tsv_file to table, returns the number of rows loaded. With keep_ids the variants
+    that are in the variant table keep their ids (see carried_ids_sql), the others keep the ids the load gave them."""
+    cursor.execute("ALTER TABLE {} DISABLE TRIGGER USER".format(table))
+    _, count = copy_variants(cursor, tsv_file, table)
+    # the columns the triggers derive, and the ids, are filled after the load in one pass that writes every row once
+    if keep_ids:
+        cursor.execute("""
+            UPDATE {0} loaded SET id = coalesce(carried.id, loaded.id), {1}
+            FROM ({2}) AS carried WHERE loaded.id = carried.loaded_id
+            """.format(table, DERIVED_COLUMNS_SQL, carried_ids_sql(table)))
+    else:
+        cursor.execute("UPDATE {} SET {}".format(table, DERIVED_COLUMNS_SQL))
+    cursor.execute("ALTER TABLE {} ENABLE TRIGGER USER".format(table))
+    return count
+
+
+def occurrences_sql(table):
+    """The ids of table with the occurrence number of their Genomic_Coordinate_hg38 in id order.
+    Releases are matched on (Genomic_Coordinate_hg38, occurrence): the rows of a coordinate that appears more than
+    once are paired up in order, so each live row matches at most one row of the release and the other way round."""
+    return """(SELECT id, "Genomic_Coordinate_hg38",
+                      row_number() OVER (PARTITION BY "Genomic_Coordinate_hg38" ORDER BY id) AS occurrence
+               FROM {})""".format(table)
+
+
+def carried_ids_sql(table):
+    """Every row of the freshly loaded table, by the id it was given in file order, with the id of the live variant
+    it matches, or NULL for a new variant. Keeping the ids means that links to a variant (its id, the GA4GH
+    hg37-<id>) survive a release."""
+    return """
+        SELECT incoming.id AS loaded_id, live.id FROM {} AS incoming
+        LEFT JOIN {} AS live USING ("Genomic_Coordinate_hg38", occurrence)
+        """.format(occurrences_sql(table), occurrences_sql('variant'))
+
+
+# Releases are loaded into variant_next and swapped in, the replaced table is kept as variant_previous
+# so that a bad release can be rolled back by swapping again.
+INDEX_DEFINITION = re.compile(r'^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON (?:\S+\.)?)(\S+)( .*)$')
+
+
+def load_release(tsv_file):
+    """Load tsv_file into a shadow table and swap it in for the variant table, returns the number of rows loaded"""
+    cursor = connection.cursor()
+    with transaction.atomic():
+        cursor.execute("DROP TABLE IF EXISTS variant_next CASCADE")
+        cursor.execute("CREATE TABLE variant_next (LIKE variant INCLUDING DEFAULTS INCLUDING STORAGE)")
+        # the load numbers the rows from variant_id_seq, the variants that are already live then take their ids back
+        count = bulk_load(cursor, tsv_file, 'variant_next', keep_ids=True)
+        copy_indexes(cursor, 'variant_next', '_next')
+        install_triggers(cursor, 'variant_next')
+    # the pass after the load leaves a dead copy of every row, it is vacuumed away before the table goes live
+    if connection.in_atomic_block:
+        # VACUUM can't run inside a transaction, as in the tests
+        cursor.execute("ANALYZE variant_next")
+    else:
+        cursor.execute("VACUUM ANALYZE variant_next")
+    swap_tables(cursor, incoming='next', retired='previous')
+    return count
+
+
+def rollback_release():
+    """Swap the previous release back in, the rolled back one is kept as variant_next"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT to_regclass('variant_previous')")
+    if cursor.fetchone()[0] is None:
+        raise ValueError('there is no previous release to roll back to')
+    swap_tables(cursor, incoming='previous', retired='next')
+
+
+def table_indexes(cursor, table):
+    cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [table])
+    return cursor.fetchall()
+
+
+def copy_indexes(cursor, table, suffix):
+    # build every index of the live table on the loaded table, named <index name><suffix>
+    cursor.execute("""SELECT conname FROM pg_constraint WHERE conrelid = 'variant'::regclass AND contype = 'p'""")
+    primary_key = cursor.fetchone()[0]
+    for name, definition in table_indexes(cursor, 'variant'):
+        cursor.execute(INDEX_DEFINITION.sub(r'\g<1>{}\g<3>{}\g<5>'.format(name + suffix, table), definition))
+        if name == primary_key:
+            cursor.execute("ALTER TABLE {0} ADD CONSTRAINT {1} PRIMARY KEY USING INDEX {1}".format(table, name + suffix))
+
+
+def install_triggers(cursor, table):
+    cursor.execute("""
+        CREATE TRIGGER variant_fts_update_trigger BEFORE UPDATE ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE variant_fts_trigger();
+        CREATE TRIGGER variant_fts_insert_trigger BEFORE INSERT ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE variant_fts_trigger();
+        CREATE TRIGGER variant_frequency_trigger BEFORE INSERT OR UPDATE ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE variant_frequency_trigger();
+        CREATE TRIGGER variant_coordinates_trigger BEFORE INSERT OR UPDATE ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE variant_coordinates_trigger();
+        """.format(table))
+
+
+def rename_indexes(cursor, table, old_suffix, new_suffix):
+    for name, _ in table_indexes(cursor, table):
+        if name.endswith(old_suffix):
+            base = name[:len(name) - len(old_suffix)] if old_suffix else name
+            cursor.execute("ALTER INDEX {} RENAME TO {}".format(name, base + new_suffix))
+
+
+# The renames need an exclusive lock on the variant table. While the swap waits for it, behind a long export
+# for instance, every new query on the table waits behind the swap. So it only waits SWAP_LOCK_TIMEOUT at a time
+# and tries again after SWAP_RETRY_DELAY seconds, up to SWAP_ATTEMPTS times.
+SWAP_LOCK_TIMEOUT = '500ms'
+SWAP_RETRY_DELAY = 1
+SWAP_ATTEMPTS = 60
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def swap_tables(cursor, incoming, retired):
+    for attempt in range(SWAP_ATTEMPTS):
+        try:
+            rename_tables(cursor, incoming, retired)
+            break
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE or attempt == SWAP_ATTEMPTS - 1:
+                raise
+            time.sleep(SWAP_RETRY_DELAY)
+    rebuild_words(cursor)
+
+
+def rename_tables(cursor, incoming, retired):
+    # everything happens in one transaction, readers wait for the renames and then see the other table
+    with transaction.atomic():
+        cursor.execute("SET LOCAL lock_timeout = %s", [SWAP_LOCK_TIMEOUT])
+        cursor.execute("DROP TABLE IF EXISTS variant_{} CASCADE".format(retired))
+        rename_indexes(cursor, 'variant', '', '_' + retired)
+        cursor.execute("ALTER TABLE variant RENAME TO variant_{}".format(retired))
+        rename_indexes(cursor, 'variant_' + incoming, '_' + incoming, '')
+        cursor.execute("ALTER TABLE variant_{} RENAME TO variant".format(incoming))
+        # the id sequence is dropped with the table that owns it
+        cursor.execute("ALTER SEQUENCE variant_id_seq OWNED BY variant.id")
+
+
+def diff_release(tsv_file):
+    """Apply only the differences between tsv_file and the variant table, matching variants on
+    Genomic_Coordinate_hg38 like load_release (see occurrences_sql). Returns the ids of the inserted,
+    updated and deleted variants."""
+    cursor = connection.cursor()
+    with transaction.atomic():
+        # the incoming rows are numbered in file order
+        cursor.execute("""
+            CREATE TEMPORARY TABLE variant_incoming (LIKE variant) ON COMMIT DROP;
+            CREATE TEMPORARY SEQUENCE variant_incoming_id_seq OWNED BY variant_incoming.id;
+            ALTER TABLE variant_incoming ALTER COLUMN id SET DEFAULT nextval('variant_incoming_id_seq');
+            """)
+        columns, _ = copy_variants(cursor, tsv_file, 'variant_incoming')
+        cursor.execute("""
+            CREATE TEMPORARY TABLE variant_matched ON COMMIT DROP AS
+                SELECT live.id, incoming.id AS incoming_id FROM {} AS live
+                JOIN {} AS incoming USING ("Genomic_Coordinate_hg38", occurrence);
+            CREATE INDEX ON variant_matched(incoming_id);
+            ANALYZE variant_incoming;
+            ANALYZE variant_matched;
+            """.format(occurrences_sql('variant'), occurrences_sql('variant_incoming')))
+
+        cursor.execute(
+            "SELECT v.id FROM variant v WHERE NOT EXISTS (SELECT 1 FROM variant_matched m WHERE m.id = v.id)")
+        deleted = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT v.id FROM variant v
+            JOIN variant_matched m ON m.id = v.id JOIN variant_incoming i ON i.id = m.incoming_id
+            WHERE ({}) IS DISTINCT FROM ({})""".format(column_list(columns, 'v'), column_list(columns, 'i')))
+        updated = [row[0] for row in cursor.fetchall()]
+        remove_words(cursor, deleted + updated)
+
+        # the search, frequency and coordinates triggers only fire for the rows that are written
+        cursor.execute("DELETE FROM variant WHERE id = ANY(%s)", [deleted])
+        cursor.execute("""
+            UPDATE variant v SET ({}) = ({}) FROM variant_matched m JOIN variant_incoming i ON i.id = m.incoming_id
+            WHERE m.id = v.id AND v.id = ANY(%s)
+            """.format(column_list(columns), column_list(columns, 'i')), [updated])
+        # in file order, so that the occurrences of a coordinate keep their order in the ids
+        cursor.execute("""
+            INSERT INTO variant ({0}) SELECT {1} FROM variant_incoming i WHERE NOT EXISTS (
+                SELECT 1 FROM variant_matched m WHERE m.incoming_id = i.id)
+            ORDER BY i.id
+            RETURNING id""".format(column_list(columns), column_list(columns, 'i')))
+        inserted = [row[0] for row in cursor.fetchall()]
+        add_words(cursor, updated + inserted)
+        # dropped here and not only on commit, inside an outer transaction this block is just a savepoint
+        cursor.execute("DROP TABLE variant_matched, variant_incoming")
+
+    return {'inserted': inserted, 'updated': updated, 'deleted': deleted}
+
+
+# Autocomplete words of each variant, with the columns and separators of 0004_autocomplete_words.
+# Each row is tokenized once: the columns split on the same separators are joined with a space first.
+WORD_COLUMNS = (
+    'Genomic_Coordinate_hg38', 'Genomic_Coordinate_hg37', 'Genomic_Coordinate_hg36', 'Condition_category_ENIGMA',
+    'Clinical_significance_ENIGMA', 'Gene_Symbol', 'Reference_Sequence', 'BIC_Identifier', 'HGVS_Protein')
+WORDS_SQL = """
+    SELECT word, count(DISTINCT id) AS frequency FROM (
+        SELECT id, left(unnest(
+            regexp_split_to_array(lower(concat_ws(' ', {})), '[\\s|''"]') ||
+            regexp_split_to_array(lower("HGVS_cDNA"), '[\\s|:''"]')), 300) AS word
+        FROM variant {{}}
+    ) AS variant_words
+    WHERE char_length(word) >= 3
+    GROUP BY word""".format(column_list(WORD_COLUMNS))
+
+
+def rebuild_words(cursor):
+    """Rebuild the autocomplete words from the whole variant table in one scan"""
+    with transaction.atomic():
+        cursor.execute("DELETE FROM words")
+        cursor.execute("INSERT INTO words (word, frequency) " + WORDS_SQL.format(''))
+
+
+def add_words(cursor, ids):
+    cursor.execute("""
+        INSERT INTO words (word, frequency) {}
+        ON CONFLICT (word) DO UPDATE SET frequency = words.frequency + EXCLUDED.frequency
+        """.format(WORDS_SQL.format('WHERE id = ANY(%s)')), [ids])
+
+
+def remove_words(cursor, ids):
+    cursor.execute("""
+        UPDATE words SET frequency = words.frequency - removed.frequency FROM ({}) AS removed
+        WHERE words.word = removed.word
+        """.format(WORDS_SQL.format('WHERE id = ANY(%s)')), [ids])
+    cursor.execute("DELETE FROM words WHERE frequency <= 0")
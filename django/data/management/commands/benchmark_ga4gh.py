@@ -0,0 +1,34 @@
+import timeit
+
+import google.protobuf.json_format as json_format
+from django.core.management.base import BaseCommand, CommandError
+
+from data.models import Variant
+from data.views import VARIANT_FIELDS, brca_to_ga4gh, ga4gh_json
+
+
+class Command(BaseCommand):
+    help = 'Time the GA4GH JSON of a page of variants built through protobuf messages and built directly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000, help='variants in the page')
+        parser.add_argument('--repeat', type=int, default=5, help='conversions per path, the best time is reported')
+
+    def handle(self, *args, **options):
+        rows = list(Variant.objects.values(*VARIANT_FIELDS)[:options['page_size']])
+
+        def messages():
+            return [json_format._MessageToJsonObject(brca_to_ga4gh(row), True) for row in rows]
+
+        def direct():
+            return [ga4gh_json(row) for row in rows]
+
+        if messages() != direct():
+            raise CommandError('the two paths give different JSON')
+
+        self.stdout.write('{} variants'.format(len(rows)))
+        baseline = None
+        for name, convert in (('protobuf', messages), ('direct', direct)):
+            best = min(timeit.repeat(convert, number=1, repeat=options['repeat']))
+            baseline = baseline or best
+            self.stdout.write('{:8} {:8.1f} ms {:6.1f}x'.format(name, best * 1000, baseline / best))
@@ -0,0 +1,36 @@
+import timeit
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from brca.serializers import ENCODERS, encoder_name
+from data.loaders import read_variants
+
+
+class Command(BaseCommand):
+    help = 'Time the installed JSON encoders on a page of variants read from an aggregated.tsv release file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tsv_file', help='path to aggregated.tsv')
+        parser.add_argument('--page-size', type=int, default=0, help='rows in the page, 0 for the whole file')
+        parser.add_argument('--repeat', type=int, default=5, help='encodes per encoder, the best time is reported')
+
+    def handle(self, *args, **options):
+        with open(options['tsv_file']) as tsv_file:
+            rows = read_variants(tsv_file)
+            header = rows.next()
+            page = [dict(zip(header, row)) for row in islice(rows, options['page_size'] or None)]
+        body = {'count': len(page), 'synonyms': 0, 'data': page}
+
+        self.stdout.write('{} rows of {} columns, responses use {}'.format(len(page), len(header), encoder_name))
+        baseline = None
+        for name in ('json', 'ujson'):
+            dumps = ENCODERS[name]
+            try:
+                size = len(dumps(body))
+            except ImportError as e:
+                self.stdout.write('{:8} unavailable ({})'.format(name, e))
+                continue
+            best = min(timeit.repeat(lambda: dumps(body), number=1, repeat=options['repeat']))
+            baseline = baseline or best
+            self.stdout.write('{:8} {:8.1f} ms {:10} bytes {:6.1f}x'.format(name, best * 1000, size, baseline / best))
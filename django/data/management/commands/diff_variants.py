@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from data.caching import new_release
+from data.loaders import diff_release
+
+
+class Command(BaseCommand):
+    help = 'Apply only the variants that were added, changed or removed in an aggregated.tsv release file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tsv_file', help='path to aggregated.tsv')
+
+    def handle(self, *args, **options):
+        with open(options['tsv_file']) as tsv_file:
+            changes = diff_release(tsv_file)
+        counts = {change: len(ids) for change, ids in changes.items()}
+        release = new_release(**counts)
+        self.stdout.write('Release {}: {inserted} inserted, {updated} updated, {deleted} deleted'.format(
+            release.id, **counts))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from data.caching import new_release
+from data.loaders import load_release
+
+
+class Command(BaseCommand):
+    help = 'Load an aggregated.tsv release file into a new variant table and swap it in for the current one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tsv_file', help='path to aggregated.tsv')
+
+    def handle(self, *args, **options):
+        with open(options['tsv_file']) as tsv_file:
+            count = load_release(tsv_file)
+        release = new_release()
+        self.stdout.write('Loaded {} variants as release {}'.format(count, release.id))
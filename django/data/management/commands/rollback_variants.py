@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from data.caching import new_release
+from data.loaders import rollback_release
+
+
+class Command(BaseCommand):
+    help = 'Swap the variant table loaded before the last load_variants back in'
+
+    def handle(self, *args, **options):
+        try:
+            rollback_release()
+        except ValueError as e:
+            raise CommandError(e)
+        release = new_release()
+        self.stdout.write('Rolled back to the previous variants as release {}'.format(release.id))
@@ -4,11 +4,13 @@ from __future__ import unicode_literals
 
 import csv
 import os.path
+from cStringIO import StringIO
 
 from django.conf import settings
 from django.db import migrations
 
-from data.models import Variant
+# The loader is frozen here for the schema of 0002, data.loaders.bulk_load loads releases into the current schema
+SOURCES = ('ENIGMA', 'ClinVar', '1000_Genomes', 'ExAC', 'LOVD', 'BIC', 'ESP', 'exLOVD')
 
 
 def load_from_csv(apps, schema_editor):
@@ -16,14 +18,21 @@ def load_from_csv(apps, schema_editor):
     with open(file_path) as tsv_file:
         reader = csv.reader(tsv_file, dialect="excel-tab")
         header = reader.next()
+        source_index = header.index('Source')
 
+        # every field is quoted so that empty strings aren't read back as NULL
+        rows = StringIO()
+        writer = csv.writer(rows, quoting=csv.QUOTE_ALL)
         for row in reader:
-
             # split Source column into booleans
-            row_dict = dict(zip(header, row))
-            for source in row_dict['Source'].split(','):
-                row_dict['Variant_in_' + source] = True
-            Variant.objects.create_variant(row_dict)
+            sources = row[source_index].split(',')
+            writer.writerow(row + [source in sources for source in SOURCES])
+        rows.seek(0)
+
+    # the insert trigger of 0002 fills the search documents of every copied row
+    columns = header + ['Variant_in_' + source for source in SOURCES]
+    schema_editor.connection.cursor().copy_expert(
+        "COPY variant ({}) FROM STDIN WITH (FORMAT csv)".format(', '.join('"{}"'.format(c) for c in columns)), rows)
 
 
 class Migration(migrations.Migration):
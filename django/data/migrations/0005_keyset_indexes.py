@@ -0,0 +1,22 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0004_autocomplete_words'),
+    ]
+
+    operations = [
+        migrations.RunSQL("""
+        CREATE INDEX variant_gene_symbol_id_idx ON variant("Gene_Symbol", id);
+        CREATE INDEX variant_genomic_coordinate_hg38_id_idx ON variant("Genomic_Coordinate_hg38", id);
+        CREATE INDEX variant_pathogenicity_default_id_idx ON variant("Pathogenicity_default", id);
+    """, """
+        DROP INDEX variant_gene_symbol_id_idx;
+        DROP INDEX variant_genomic_coordinate_hg38_id_idx;
+        DROP INDEX variant_pathogenicity_default_id_idx;
+    """)
+
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_release(apps, schema_editor):
+    # the variants loaded by 0003_data are the first release
+    DataRelease = apps.get_model('data', 'DataRelease')
+    DataRelease.objects.create()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataRelease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'data_release',
+            },
+        ),
+        migrations.RunPython(create_release, migrations.RunPython.noop),
+    ]
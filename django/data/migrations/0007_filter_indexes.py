@@ -0,0 +1,25 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0006_data_release'),
+    ]
+
+    operations = [
+        # text_pattern_ops lets LIKE 'value%' use the index whatever the database collation is
+        migrations.RunSQL("""
+        CREATE INDEX variant_gene_symbol_pattern_idx ON variant("Gene_Symbol" text_pattern_ops);
+        CREATE INDEX variant_pathogenicity_default_pattern_idx ON variant("Pathogenicity_default" text_pattern_ops);
+        CREATE INDEX variant_clinical_significance_enigma_pattern_idx
+            ON variant("Clinical_significance_ENIGMA" text_pattern_ops);
+        ANALYZE variant;
+    """, """
+        DROP INDEX variant_gene_symbol_pattern_idx;
+        DROP INDEX variant_pathogenicity_default_pattern_idx;
+        DROP INDEX variant_clinical_significance_enigma_pattern_idx;
+    """)
+
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0007_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datarelease',
+            name='inserted',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='datarelease',
+            name='updated',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='datarelease',
+            name='deleted',
+            field=models.IntegerField(null=True),
+        ),
+    ]
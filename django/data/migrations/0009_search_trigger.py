@@ -0,0 +1,164 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0008_data_release_changes'),
+    ]
+
+    # The trigger used to build the standard document twice per row, once directly and once inside
+    # variant_fts_document. It now builds it once from the NEW row, which also means it no longer
+    # depends on the variant row type and works on any table loaded by data.loaders.
+    # The SQL is frozen here, data.loaders.SEARCH_TRIGGER_FUNCTION is the current version of the function.
+    operations = [
+        migrations.RunSQL("""
+        CREATE OR REPLACE FUNCTION variant_fts_trigger() RETURNS TRIGGER AS $$
+        DECLARE
+            standard tsvector;
+        BEGIN
+            standard := to_tsvector('pg_catalog.simple', concat_ws(' ',
+                NEW."Source", NEW."URL_ENIGMA", NEW."Condition_ID_type_ENIGMA",
+                NEW."Condition_ID_value_ENIGMA", NEW."Condition_category_ENIGMA",
+                NEW."Clinical_significance_ENIGMA", NEW."Date_last_evaluated_ENIGMA",
+                NEW."Assertion_method_ENIGMA", NEW."Assertion_method_citation_ENIGMA",
+                NEW."Clinical_significance_citations_ENIGMA", NEW."Comment_on_clinical_significance_ENIGMA",
+                NEW."Collection_method_ENIGMA", NEW."Allele_origin_ENIGMA", NEW."ClinVarAccession_ENIGMA",
+                NEW."Clinical_Significance_ClinVar", NEW."Date_Last_Updated_ClinVar", NEW."Submitter_ClinVar",
+                NEW."SCV_ClinVar", NEW."Allele_Origin_ClinVar", NEW."Method_ClinVar",
+                NEW."Functional_analysis_result_LOVD", NEW."Origin_of_variant_LOVD",
+                NEW."Functional_analysis_technique_LOVD", NEW."Variant_frequency_LOVD",
+                NEW."Variant_haplotype_LOVD", NEW."Minor_allele_frequency_ESP",
+                NEW."EUR_Allele_frequency_1000_Genomes", NEW."AFR_Allele_frequency_1000_Genomes",
+                NEW."AMR_Allele_frequency_1000_Genomes", NEW."EAS_Allele_frequency_1000_Genomes",
+                NEW."Allele_frequency_1000_Genomes", NEW."SAS_Allele_frequency_1000_Genomes",
+                NEW."Allele_frequency_ExAC", NEW."Patient_nationality_BIC", NEW."Clinical_importance_BIC",
+                NEW."Clinical_classification_BIC", NEW."Literature_citation_BIC",
+                NEW."Number_of_family_member_carrying_mutation_BIC", NEW."Germline_or_Somatic_BIC",
+                NEW."Ethnicity_BIC", NEW."Mutation_type_BIC", NEW."IARC_class_exLOVD",
+                NEW."Sum_family_LR_exLOVD", NEW."Combined_prior_probablility_exLOVD",
+                NEW."Literature_source_exLOVD", NEW."Co_occurrence_LR_exLOVD",
+                NEW."Posterior_probability_exLOVD", NEW."Missense_analysis_prior_probability_exLOVD",
+                NEW."Segregation_LR_exLOVD", NEW."SIFT_VEP", NEW."PolyPhen_VEP", NEW."Gene_Symbol",
+                NEW."Reference_Sequence", NEW."HGVS_cDNA", NEW."BIC_Identifier", NEW."HGVS_Protein",
+                NEW."Protein_Change", NEW."Allele_Frequency", NEW."Max_Allele_Frequency",
+                NEW."Genomic_Coordinate_hg38", NEW."Source_URL", NEW."Discordant", NEW."Pathogenicity_default",
+                NEW."Pathogenicity_research"));
+            NEW.fts_standard := standard;
+            NEW.fts_document := standard || to_tsvector('pg_catalog.simple', concat_ws(' ',
+                NEW."Genomic_Coordinate_hg37", NEW."Genomic_Coordinate_hg36", NEW."Synonyms"));
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP FUNCTION variant_fts_document(variant);
+        DROP FUNCTION variant_fts_standard(variant);
+        DROP FUNCTION variant_fts_synonyms(variant);
+    """,
+        # the functions of 0002_search_index
+        """
+    CREATE FUNCTION variant_fts_standard(v variant) RETURNS tsvector AS $$
+        DECLARE
+            fts_standard TEXT;
+        BEGIN
+            SELECT concat_ws(' ',
+                v."Source",
+                v."URL_ENIGMA",
+                v."Condition_ID_type_ENIGMA",
+                v."Condition_ID_value_ENIGMA",
+                v."Condition_category_ENIGMA",
+                v."Clinical_significance_ENIGMA",
+                v."Date_last_evaluated_ENIGMA",
+                v."Assertion_method_ENIGMA",
+                v."Assertion_method_citation_ENIGMA",
+                v."Clinical_significance_citations_ENIGMA",
+                v."Comment_on_clinical_significance_ENIGMA",
+                v."Collection_method_ENIGMA",
+                v."Allele_origin_ENIGMA",
+                v."ClinVarAccession_ENIGMA",
+                v."Clinical_Significance_ClinVar",
+                v."Date_Last_Updated_ClinVar",
+                v."Submitter_ClinVar",
+                v."SCV_ClinVar",
+                v."Allele_Origin_ClinVar",
+                v."Method_ClinVar",
+                v."Functional_analysis_result_LOVD",
+                v."Origin_of_variant_LOVD",
+                v."Functional_analysis_technique_LOVD",
+                v."Variant_frequency_LOVD",
+                v."Variant_haplotype_LOVD",
+                v."Minor_allele_frequency_ESP",
+                v."EUR_Allele_frequency_1000_Genomes",
+                v."AFR_Allele_frequency_1000_Genomes",
+                v."AMR_Allele_frequency_1000_Genomes",
+                v."EAS_Allele_frequency_1000_Genomes",
+                v."Allele_frequency_1000_Genomes",
+                v."SAS_Allele_frequency_1000_Genomes",
+                v."Allele_frequency_ExAC",
+                v."Patient_nationality_BIC",
+                v."Clinical_importance_BIC",
+                v."Clinical_classification_BIC",
+                v."Literature_citation_BIC",
+                v."Number_of_family_member_carrying_mutation_BIC",
+                v."Germline_or_Somatic_BIC",
+                v."Ethnicity_BIC",
+                v."Mutation_type_BIC",
+                v."IARC_class_exLOVD",
+                v."Sum_family_LR_exLOVD",
+                v."Combined_prior_probablility_exLOVD",
+                v."Literature_source_exLOVD",
+                v."Co_occurrence_LR_exLOVD",
+                v."Posterior_probability_exLOVD",
+                v."Missense_analysis_prior_probability_exLOVD",
+                v."Segregation_LR_exLOVD",
+                v."SIFT_VEP",
+                v."PolyPhen_VEP",
+                v."Gene_Symbol",
+                v."Reference_Sequence",
+                v."HGVS_cDNA",
+                v."BIC_Identifier",
+                v."HGVS_Protein",
+                v."Protein_Change",
+                v."Allele_Frequency",
+                v."Max_Allele_Frequency",
+                v."Genomic_Coordinate_hg38",
+                v."Source_URL",
+                v."Discordant",
+                v."Pathogenicity_default",
+                v."Pathogenicity_research")
+    INTO fts_standard;
+            RETURN to_tsvector('pg_catalog.simple', fts_standard);
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION variant_fts_synonyms(v variant) RETURNS tsvector AS $$
+        DECLARE
+            fts_synonyms TEXT;
+        BEGIN
+            SELECT concat_ws(' ',
+                v."Genomic_Coordinate_hg37",
+                v."Genomic_Coordinate_hg36",
+                v."Synonyms")
+            INTO
+                fts_synonyms;
+            RETURN to_tsvector('pg_catalog.simple', fts_synonyms);
+        END;
+        $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION variant_fts_document(v variant) RETURNS tsvector AS $$
+        BEGIN
+            RETURN variant_fts_standard(v) || variant_fts_synonyms(v);
+        END;
+        $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION variant_fts_trigger() RETURNS TRIGGER AS $$
+    BEGIN
+    NEW.fts_standard=variant_fts_standard(NEW);
+    NEW.fts_document=variant_fts_document(NEW);
+    RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    ]
@@ -0,0 +1,40 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0009_search_trigger'),
+    ]
+
+    # Suggestions are ranked by the number of variants each word occurs in, ties in code point order.
+    # For short terms, where the prefix matches are many, the left(word, n) indexes return the top ranked
+    # words with an index-only scan that stops at the LIMIT.
+    operations = [
+        migrations.RunSQL("""
+        DROP TABLE IF EXISTS words;
+        CREATE TABLE words AS SELECT left(word, 300) as word, count(DISTINCT id) as frequency FROM (
+        SELECT id, regexp_split_to_table(lower("Genomic_Coordinate_hg38"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Genomic_Coordinate_hg37"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Genomic_Coordinate_hg36"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Condition_category_ENIGMA"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Clinical_significance_ENIGMA"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Gene_Symbol"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("Reference_Sequence"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("HGVS_cDNA"), '[\s|:''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("BIC_Identifier"), '[\s|''"]') as word from variant UNION ALL
+        SELECT id, regexp_split_to_table(lower("HGVS_Protein"), '[\s|''"]') as word from variant
+        )
+        AS combined_words
+        WHERE char_length(word) >= 3
+        GROUP BY left(word, 300);
+
+        CREATE UNIQUE INDEX words_idx ON words(word text_pattern_ops);
+        CREATE INDEX words_prefix_1_idx ON words(left(word, 1), frequency DESC, word COLLATE "C");
+        CREATE INDEX words_prefix_2_idx ON words(left(word, 2), frequency DESC, word COLLATE "C");
+        CREATE INDEX words_prefix_3_idx ON words(left(word, 3), frequency DESC, word COLLATE "C");
+        ANALYZE words;
+    """)
+
+    ]
@@ -0,0 +1,91 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0010_words_frequency'),
+    ]
+
+    # The frequency columns are text like "0.498000 (SAS from 1000 Genomes)" or "-". Their parsed
+    # numbers are kept in double precision columns next to them, so that frequency ranges are index scans.
+    # The SQL is frozen here, data.loaders.FREQUENCY_COLUMNS and FREQUENCY_TRIGGER_FUNCTION are the current versions.
+    operations = [
+        migrations.RunSQL(
+            r"""
+            ALTER TABLE variant
+                ADD COLUMN "Allele_Frequency_numeric" double precision,
+                ADD COLUMN "Max_Allele_Frequency_numeric" double precision,
+                ADD COLUMN "Allele_frequency_ExAC_numeric" double precision,
+                ADD COLUMN "Minor_allele_frequency_ESP_numeric" double precision,
+                ADD COLUMN "Allele_frequency_1000_Genomes_numeric" double precision,
+                ADD COLUMN "AFR_Allele_frequency_1000_Genomes_numeric" double precision,
+                ADD COLUMN "AMR_Allele_frequency_1000_Genomes_numeric" double precision,
+                ADD COLUMN "EAS_Allele_frequency_1000_Genomes_numeric" double precision,
+                ADD COLUMN "EUR_Allele_frequency_1000_Genomes_numeric" double precision,
+                ADD COLUMN "SAS_Allele_frequency_1000_Genomes_numeric" double precision;
+
+            ALTER TABLE variant DISABLE TRIGGER USER;
+            UPDATE variant SET
+                "Allele_Frequency_numeric" = substring("Allele_Frequency" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "Max_Allele_Frequency_numeric" = substring("Max_Allele_Frequency" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "Allele_frequency_ExAC_numeric" = substring("Allele_frequency_ExAC" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "Minor_allele_frequency_ESP_numeric" = substring("Minor_allele_frequency_ESP" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "Allele_frequency_1000_Genomes_numeric" = substring("Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "AFR_Allele_frequency_1000_Genomes_numeric" = substring("AFR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "AMR_Allele_frequency_1000_Genomes_numeric" = substring("AMR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "EAS_Allele_frequency_1000_Genomes_numeric" = substring("EAS_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "EUR_Allele_frequency_1000_Genomes_numeric" = substring("EUR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision,
+                "SAS_Allele_frequency_1000_Genomes_numeric" = substring("SAS_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+            ALTER TABLE variant ENABLE TRIGGER USER;
+
+            CREATE OR REPLACE FUNCTION variant_frequency_trigger() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW."Allele_Frequency_numeric" := substring(NEW."Allele_Frequency" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."Max_Allele_Frequency_numeric" := substring(NEW."Max_Allele_Frequency" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."Allele_frequency_ExAC_numeric" := substring(NEW."Allele_frequency_ExAC" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."Minor_allele_frequency_ESP_numeric" := substring(NEW."Minor_allele_frequency_ESP" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."Allele_frequency_1000_Genomes_numeric" := substring(NEW."Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."AFR_Allele_frequency_1000_Genomes_numeric" := substring(NEW."AFR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."AMR_Allele_frequency_1000_Genomes_numeric" := substring(NEW."AMR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."EAS_Allele_frequency_1000_Genomes_numeric" := substring(NEW."EAS_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."EUR_Allele_frequency_1000_Genomes_numeric" := substring(NEW."EUR_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                NEW."SAS_Allele_frequency_1000_Genomes_numeric" := substring(NEW."SAS_Allele_frequency_1000_Genomes" from '^\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)')::double precision;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER variant_frequency_trigger BEFORE INSERT OR UPDATE ON variant
+                FOR EACH ROW EXECUTE PROCEDURE variant_frequency_trigger();
+
+            CREATE INDEX variant_allele_frequency_numeric_idx ON variant("Allele_Frequency_numeric");
+            CREATE INDEX variant_max_allele_frequency_numeric_idx ON variant("Max_Allele_Frequency_numeric");
+            CREATE INDEX variant_allele_frequency_exac_numeric_idx ON variant("Allele_frequency_ExAC_numeric");
+            CREATE INDEX variant_minor_allele_frequency_esp_numeric_idx ON variant("Minor_allele_frequency_ESP_numeric");
+            CREATE INDEX variant_allele_frequency_1000_genomes_numeric_idx ON variant("Allele_frequency_1000_Genomes_numeric");
+            CREATE INDEX variant_afr_allele_frequency_1000_genomes_numeric_idx ON variant("AFR_Allele_frequency_1000_Genomes_numeric");
+            CREATE INDEX variant_amr_allele_frequency_1000_genomes_numeric_idx ON variant("AMR_Allele_frequency_1000_Genomes_numeric");
+            CREATE INDEX variant_eas_allele_frequency_1000_genomes_numeric_idx ON variant("EAS_Allele_frequency_1000_Genomes_numeric");
+            CREATE INDEX variant_eur_allele_frequency_1000_genomes_numeric_idx ON variant("EUR_Allele_frequency_1000_Genomes_numeric");
+            CREATE INDEX variant_sas_allele_frequency_1000_genomes_numeric_idx ON variant("SAS_Allele_frequency_1000_Genomes_numeric");
+
+            ANALYZE variant;
+            """,
+            """
+            DROP TRIGGER variant_frequency_trigger ON variant;
+            DROP FUNCTION variant_frequency_trigger();
+            ALTER TABLE variant
+                DROP COLUMN "Allele_Frequency_numeric",
+                DROP COLUMN "Max_Allele_Frequency_numeric",
+                DROP COLUMN "Allele_frequency_ExAC_numeric",
+                DROP COLUMN "Minor_allele_frequency_ESP_numeric",
+                DROP COLUMN "Allele_frequency_1000_Genomes_numeric",
+                DROP COLUMN "AFR_Allele_frequency_1000_Genomes_numeric",
+                DROP COLUMN "AMR_Allele_frequency_1000_Genomes_numeric",
+                DROP COLUMN "EAS_Allele_frequency_1000_Genomes_numeric",
+                DROP COLUMN "EUR_Allele_frequency_1000_Genomes_numeric",
+                DROP COLUMN "SAS_Allele_frequency_1000_Genomes_numeric";
+            """)
+
+    ]
@@ -0,0 +1,62 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('data', '0011_frequency_columns'),
+    ]
+
+    # The Genomic_Coordinate_<assembly> columns are text like "chr17:41276045:A>G". They are parsed into
+    # typed columns, and the (chromosome, position, id) indexes serve GA4GH region searches and their paging.
+    # The SQL is frozen here, data.loaders.COORDINATES_TRIGGER_FUNCTION is the current version of the trigger.
+    operations = [
+        migrations.RunSQL(
+            r"""
+            ALTER TABLE variant
+                ADD COLUMN "Chromosome_hg36" text, ADD COLUMN "Position_hg36" integer, ADD COLUMN "Ref_hg36" text, ADD COLUMN "Alt_hg36" text,
+                ADD COLUMN "Chromosome_hg37" text, ADD COLUMN "Position_hg37" integer, ADD COLUMN "Ref_hg37" text, ADD COLUMN "Alt_hg37" text,
+                ADD COLUMN "Chromosome_hg38" text, ADD COLUMN "Position_hg38" integer, ADD COLUMN "Ref_hg38" text, ADD COLUMN "Alt_hg38" text;
+
+            ALTER TABLE variant DISABLE TRIGGER USER;
+            UPDATE variant SET
+                ("Chromosome_hg36", "Position_hg36", "Ref_hg36", "Alt_hg36") =
+                    (SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches("Genomic_Coordinate_hg36", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m),
+                ("Chromosome_hg37", "Position_hg37", "Ref_hg37", "Alt_hg37") =
+                    (SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches("Genomic_Coordinate_hg37", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m),
+                ("Chromosome_hg38", "Position_hg38", "Ref_hg38", "Alt_hg38") =
+                    (SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches("Genomic_Coordinate_hg38", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m);
+            ALTER TABLE variant ENABLE TRIGGER USER;
+
+            CREATE OR REPLACE FUNCTION variant_coordinates_trigger() RETURNS TRIGGER AS $$
+            BEGIN
+                SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches(NEW."Genomic_Coordinate_hg36", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m
+                    INTO NEW."Chromosome_hg36", NEW."Position_hg36", NEW."Ref_hg36", NEW."Alt_hg36";
+                SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches(NEW."Genomic_Coordinate_hg37", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m
+                    INTO NEW."Chromosome_hg37", NEW."Position_hg37", NEW."Ref_hg37", NEW."Alt_hg37";
+                SELECT m[1], m[2]::integer, m[3], m[4] FROM regexp_matches(NEW."Genomic_Coordinate_hg38", '(chr[0-9A-Za-z]+):g?\.?([0-9]+):([A-Za-z-]*)>([A-Za-z-]*)$') AS m
+                    INTO NEW."Chromosome_hg38", NEW."Position_hg38", NEW."Ref_hg38", NEW."Alt_hg38";
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER variant_coordinates_trigger BEFORE INSERT OR UPDATE ON variant
+                FOR EACH ROW EXECUTE PROCEDURE variant_coordinates_trigger();
+
+            CREATE INDEX variant_hg36_region_idx ON variant("Chromosome_hg36", "Position_hg36", id);
+            CREATE INDEX variant_hg37_region_idx ON variant("Chromosome_hg37", "Position_hg37", id);
+            CREATE INDEX variant_hg38_region_idx ON variant("Chromosome_hg38", "Position_hg38", id);
+
+            ANALYZE variant;
+            """,
+            """
+            DROP TRIGGER variant_coordinates_trigger ON variant;
+            DROP FUNCTION variant_coordinates_trigger();
+            ALTER TABLE variant
+                DROP COLUMN "Chromosome_hg36", DROP COLUMN "Position_hg36", DROP COLUMN "Ref_hg36", DROP COLUMN "Alt_hg36",
+                DROP COLUMN "Chromosome_hg37", DROP COLUMN "Position_hg37", DROP COLUMN "Ref_hg37", DROP COLUMN "Alt_hg37",
+                DROP COLUMN "Chromosome_hg38", DROP COLUMN "Position_hg38", DROP COLUMN "Ref_hg38", DROP COLUMN "Alt_hg38";
+            """)
+
+    ]
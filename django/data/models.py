@@ -90,4 +90,17 @@ class Variant(models.Model):
     class Meta:
         db_table = 'variant'
 
+
+class DataRelease(models.Model):
+    # A new row is written every time the variant table is reloaded,
+    # the latest id versions everything cached from the variant data
+    loaded_at = models.DateTimeField(auto_now_add=True)
+    # change counts of releases applied as a diff, full loads leave them empty
+    inserted = models.IntegerField(null=True)
+    updated = models.IntegerField(null=True)
+    deleted = models.IntegerField(null=True)
+
+    class Meta:
+        db_table = 'data_release'
+
 #class Phase_3_Release()
\ No newline at end of file
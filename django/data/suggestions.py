@@ -0,0 +1,58 @@
+import bisect
+import heapq
+import threading
+
+from django.db import connection
+
+from .caching import current_release
+
+# Terms up to this long are ranked with the words_prefix_<n>_idx indexes (see 0010_words_frequency)
+RANKED_PREFIX_LENGTH = 3
+# The most suggestions a request gets, which also bounds the results kept for short terms
+MAX_SUGGESTIONS = 50
+
+
+class WordIndex(object):
+    """Sorted in-memory copy of the words table, loaded once per worker and again for every new data release"""
+
+    def __init__(self):
+        self.release = None
+        # the sorted words, their frequencies and the kept results of short terms, replaced
+        # together so that a reader never sees parts of two releases
+        self.index = ([], [], {})
+        self.lock = threading.Lock()
+
+    def load(self):
+        release = current_release()
+        if release != self.release:
+            with self.lock:
+                if release != self.release:
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT word, frequency FROM words")
+                    rows = sorted(cursor.fetchall())
+                    self.index = ([word for word, _ in rows], [frequency for _, frequency in rows], {})
+                    self.release = release
+
+    def suggest(self, term, limit):
+        # the words starting with term are a contiguous run in the sorted list, the most frequent of them
+        # are picked with a bounded heap. Short terms match many words so their results are kept.
+        self.load()
+        # The kept results are the MAX_SUGGESTIONS best words of the term, sliced to the limit. Only terms that
+        # are the prefix of some word are kept, so there are at most as many as there are short prefixes.
+        words, frequencies, ranked = self.index
+        if term in ranked:
+            return ranked[term][:limit]
+
+        start = bisect.bisect_left(words, term)
+        end = bisect.bisect_left(words, term[:-1] + unichr(ord(term[-1]) + 1), start) if term else len(words)
+        keep = len(term) <= RANKED_PREFIX_LENGTH and start < end
+        count = max(limit, MAX_SUGGESTIONS) if keep else limit
+        suggestions = heapq.nsmallest(count, xrange(start, end), key=lambda i: (-frequencies[i], words[i]))
+        suggestions = [words[i] for i in suggestions]
+
+        if keep:
+            ranked[term] = suggestions
+        return suggestions[:limit]
+
+
+word_index = WordIndex()
@@ -1,19 +1,31 @@
+import csv
 import json
 import os
+import re
+import tempfile
 import unittest
+from StringIO import StringIO
 from urllib import quote
 
 
-from django.http import JsonResponse, HttpResponse
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
 
 from brca import settings
+from brca.serializers import JsonResponse, dumps, json_dumps, jsonable, encoder_name
 from data import test_data
+from data.caching import new_release
+from data.loaders import load_release, rollback_release, table_indexes, diff_release
+from data.loaders import tsvector_sql, rebuild_words, STANDARD_COLUMNS, SYNONYM_COLUMNS
 from data.models import Variant
-from data.views import index, autocomplete
+from data.suggestions import word_index, MAX_SUGGESTIONS
+from data.views import index, autocomplete, lollipop, apply_search
 
 ##################### MY EDITS #########################
+from data.views import VARIANT_FIELDS, ga4gh_json, variant_set
 from data.views import index_num_2, brca_to_ga4gh, ErrorMessages, get_offset, get_var_by_id, get_variantSet, get_varset_by_id, varsetId_empty_catcher, empty_varId_catcher
 from django.test import Client
 c = Client()
@@ -23,11 +35,25 @@ from ga4gh import variants_pb2 as vrs
 
 ##################### MY EDITS END#####################
 
+try:
+    import ujson
+    ujson_installed = True
+except ImportError:
+    ujson_installed = False
+
+
+def streamed_json(response):
+    return json.loads(''.join(response.streaming_content))
+
+
 class VariantTestCase(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
         datafile = os.path.join(settings.BASE_DIR, 'data', 'resources', 'aggregated.tsv')
         self.db_size = sum(1 for _ in open(datafile)) - 1
+        cache.clear()
+        caches['responses'].clear()
+        caches['lollipop'].clear()
 
     def test_variant_model(self):
         """Create a new variant and then retrieve it by the Genomic_Coordinate_hg38 column"""
@@ -37,6 +63,120 @@ class VariantTestCase(TestCase):
         retrieved_variant = Variant.objects.get(Genomic_Coordinate_hg38="chr17:999999:A>G")
         self.assertIsNotNone(retrieved_variant)
 
+    def test_load_release(self):
+        """A release is swapped in with the same search documents as the trigger and can be rolled back"""
+        datafile = os.path.join(settings.BASE_DIR, 'data', 'resources', 'aggregated.tsv')
+        created = Variant.objects.create_variant(row=(test_data.new_variant()))
+        cursor = connection.cursor()
+        indexes = sorted(name for name, _ in table_indexes(cursor, 'variant'))
+        ids = dict(Variant.objects.exclude(id=created.id).values_list('Genomic_Coordinate_hg38', 'id'))
+
+        with open(datafile) as tsv_file:
+            self.assertEqual(load_release(tsv_file), self.db_size)
+        self.assertEqual(Variant.objects.count(), self.db_size)
+        self.assertFalse(Variant.objects.filter(id=created.id).exists())
+        # the variants keep their ids
+        self.assertEqual(dict(Variant.objects.values_list('Genomic_Coordinate_hg38', 'id')), ids)
+        self.assertEqual(sorted(name for name, _ in table_indexes(cursor, 'variant')), indexes)
+
+        variant = Variant.objects.filter(Variant_in_ClinVar=True).first()
+        self.assertIn('ClinVar', variant.Source.split(','))
+
+        # the loader derives the same columns as the triggers
+        derived = ['fts_standard', 'fts_document', 'Allele_Frequency_numeric', 'Position_hg37', 'Alt_hg38']
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loaded_columns AS SELECT id, {0} FROM variant;
+            UPDATE variant SET id = id;
+            SELECT count(*) FROM variant v JOIN loaded_columns l USING (id) WHERE ({1}) IS DISTINCT FROM ({2})
+            """.format(', '.join('"{}"'.format(c) for c in derived), ', '.join('v."{}"'.format(c) for c in derived),
+                       ', '.join('l."{}"'.format(c) for c in derived)))
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+        # the triggers fire on the swapped in table
+        new_variant = Variant.objects.create_variant(row=(test_data.new_variant()))
+        self.assertGreater(new_variant.id, max(ids.values()))
+        cursor.execute("SELECT fts_document IS NOT NULL FROM variant WHERE id = %s", [new_variant.id])
+        self.assertTrue(cursor.fetchone()[0])
+
+        rollback_release()
+        self.assertTrue(Variant.objects.filter(id=created.id).exists())
+        self.assertEqual(Variant.objects.count(), self.db_size + 1)
+
+    def test_search_trigger(self):
+        """The trigger builds the same search documents as 0002_search_index and the bulk loader"""
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TEMPORARY TABLE loaded_documents AS SELECT id, fts_standard, fts_document FROM variant;
+            UPDATE variant SET id = id;
+            SELECT count(*) FROM variant v JOIN loaded_documents d USING (id)
+            WHERE v.fts_standard IS DISTINCT FROM d.fts_standard OR v.fts_document IS DISTINCT FROM d.fts_document
+            OR v.fts_standard IS DISTINCT FROM {0}
+            OR v.fts_document IS DISTINCT FROM {0} || {1}""".format(
+            tsvector_sql(STANDARD_COLUMNS, 'v'), tsvector_sql(SYNONYM_COLUMNS, 'v')))
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_rebuild_words(self):
+        """Tokenizing each variant once gives the same words as 0010_words_frequency"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT word, frequency FROM words ORDER BY word")
+        migrated = cursor.fetchall()
+        rebuild_words(cursor)
+        cursor.execute("SELECT word, frequency FROM words ORDER BY word")
+        self.assertEqual(migrated, cursor.fetchall())
+
+    def test_diff_release(self):
+        """Only the variants that changed in a release are written"""
+        datafile = os.path.join(settings.BASE_DIR, 'data', 'resources', 'aggregated.tsv')
+        with open(datafile) as tsv_file:
+            self.assertEqual(diff_release(tsv_file), {'inserted': [], 'updated': [], 'deleted': []})
+
+        with open(datafile) as tsv_file:
+            rows = list(csv.reader(tsv_file, dialect='excel-tab'))
+        header, first, removed = rows[0], rows[1], rows[-1]
+        first[header.index('Pathogenicity_research')] = 'Changed'
+        first[header.index('BIC_Identifier')] = 'zzz_new_identifier'
+        created = Variant.objects.create_variant(row=(test_data.new_variant()))
+
+        with tempfile.NamedTemporaryFile() as release:
+            csv.writer(release, dialect='excel-tab').writerows(rows[:-1])
+            release.flush()
+            with open(release.name) as tsv_file:
+                changes = diff_release(tsv_file)
+
+        self.assertEqual(len(changes['inserted']), 0)
+        self.assertEqual(len(changes['updated']), 1)
+        self.assertEqual(len(changes['deleted']), 2)
+        self.assertIn(created.id, changes['deleted'])
+        self.assertEqual(Variant.objects.count(), self.db_size - 1)
+        self.assertFalse(Variant.objects.filter(
+            Genomic_Coordinate_hg38=removed[header.index('Genomic_Coordinate_hg38')]).exists())
+        updated = Variant.objects.get(id=changes['updated'][0])
+        self.assertEqual(updated.Pathogenicity_research, 'Changed')
+        self.assertEqual(apply_search(Variant.objects, 'changed').filter(id=updated.id).count(), 1)
+
+        # the autocomplete words follow the changed variants
+        cursor = connection.cursor()
+        cursor.execute("SELECT frequency FROM words WHERE word = 'zzz_new_identifier'")
+        self.assertEqual(cursor.fetchone()[0], 1)
+        cursor.execute("SELECT word, frequency FROM words ORDER BY word")
+        maintained = cursor.fetchall()
+        rebuild_words(cursor)
+        cursor.execute("SELECT word, frequency FROM words ORDER BY word")
+        self.assertEqual(maintained, cursor.fetchall())
+
+        # a coordinate that appears twice is matched occurrence by occurrence
+        def diff(rows):
+            with tempfile.NamedTemporaryFile() as release:
+                csv.writer(release, dialect='excel-tab').writerows(rows)
+                release.flush()
+                with open(release.name) as tsv_file:
+                    return diff_release(tsv_file)
+
+        duplicated = diff(rows[:-1] + [rows[2]])
+        self.assertEqual((len(duplicated['inserted']), duplicated['updated'], duplicated['deleted']), (1, [], []))
+        self.assertEqual(diff(rows[:-1] + [rows[2]]), {'inserted': [], 'updated': [], 'deleted': []})
+        self.assertEqual(diff(rows[:-1]), {'inserted': [], 'updated': [], 'deleted': duplicated['inserted']})
+
     def test_index_resource_json(self):
         """Searching for all the data in json format returns a JsonResponse"""
         request = self.factory.get(
@@ -48,13 +188,37 @@ class VariantTestCase(TestCase):
         self.assertEqual(json.loads(response.content)['count'], self.db_size)
 
     def test_index_resource_csv(self):
-        """Searching for all the data in csv format returns an HttpResponse"""
+        """Searching for all the data in csv format streams every row with a header"""
         request = self.factory.get(
-            '/data/?format=json&order_by=Gene_Symbol&direction=ascending&page_size=20&page_num=0&search_term=')
+            '/data/?format=csv&order_by=Gene_Symbol&direction=ascending&page_size=20&page_num=0&search_term=')
         response = index(request)
 
-        self.assertIsInstance(response, HttpResponse)
+        self.assertIsInstance(response, StreamingHttpResponse)
         self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(StringIO(''.join(response.streaming_content))))
+        self.assertEqual(len(rows), self.db_size + 1)
+        self.assertIn('Genomic_Coordinate_hg38', rows[0])
+
+    def test_index_resource_csv_chunks(self):
+        """The csv rows are sent on in chunks of EXPORT_COPY_CHUNK_SIZE bytes, not one by one"""
+        url = '/data/?format=csv&order_by=Gene_Symbol&direction=ascending&page_size=20&page_num=0&search_term='
+        with override_settings(EXPORT_COPY_CHUNK_SIZE=4096):
+            chunks = list(index(self.factory.get(url)).streaming_content)
+
+        body = ''.join(chunks)
+        self.assertTrue(all(len(chunk) >= 4096 for chunk in chunks[:-1]))
+        self.assertLessEqual(len(chunks), len(body) // 4096 + 1)
+        self.assertEqual(len(list(csv.reader(StringIO(body)))), self.db_size + 1)
+
+    def test_index_resource_csv_filtered(self):
+        """Filters are passed to the csv export as query parameters"""
+        request = self.factory.get(
+            '/data/?format=csv&filter=Gene_Symbol&filterValue=BRCA1&order_by=Gene_Symbol&direction=ascending')
+        response = index(request)
+
+        rows = list(csv.DictReader(StringIO(''.join(response.streaming_content))))
+        self.assertTrue(rows)
+        self.assertTrue(all(row['Gene_Symbol'] == 'BRCA1' for row in rows))
 
     def search_by_id(self):
         """Searching for a variant by id using a filter should return the expected result"""
@@ -67,6 +231,239 @@ class VariantTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertJSONEqual(response.content, {"count": 1, "data": [test_data.existing_variant()]})
 
+    def test_index_count_cached_per_release(self):
+        """Counts are cached until a new data release is loaded"""
+        url = '/data/?format=json&order_by=Gene_Symbol&direction=ascending&page_size=20&page_num=0&search_term='
+        self.assertEqual(json.loads(index(self.factory.get(url)).content)['count'], self.db_size)
+
+        Variant.objects.create_variant(row=(test_data.new_variant()))
+        self.assertEqual(json.loads(index(self.factory.get(url)).content)['count'], self.db_size)
+
+        new_release()
+        self.assertEqual(json.loads(index(self.factory.get(url)).content)['count'], self.db_size + 1)
+
+    def test_index_search_counts(self):
+        """count and synonyms match separate counts over fts_document and fts_standard"""
+        for search_term in ('c.2123', 'brca1', 'ivs7', 'benign', 'chr17:41'):
+            matches = apply_search(Variant.objects, search_term)
+            expected_count = matches.count()
+            expected_synonyms = expected_count - apply_search(matches, search_term, search_column='fts_standard').count()
+
+            request = self.factory.get(
+                '/data/?format=json&order_by=Gene_Symbol&direction=ascending&page_size=20&page_num=0&search_term=%s'
+                % quote(search_term))
+            response = json.loads(index(request).content)
+            self.assertEqual(response['count'], expected_count)
+            self.assertEqual(response['synonyms'], expected_synonyms)
+
+    def test_index_response_cached(self):
+        """Repeating a query in any parameter order is answered without touching the database"""
+        response = index(self.factory.get(
+            '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0&include=Variant_in_ENIGMA'
+            '&include=Variant_in_ClinVar&filter=Gene_Symbol&filterValue=BRCA1'))
+        with self.assertNumQueries(0):
+            cached = index(self.factory.get(
+                '/data/?filter=Gene_Symbol&filterValue=BRCA1&include=Variant_in_ClinVar&include=Variant_in_ENIGMA'
+                '&page_num=0&page_size=20&order_by=Gene_Symbol&format=json'))
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], 'application/json')
+        self.assertEqual(cached['Access-Control-Allow-Origin'], '*')
+
+        # a new release is queried again
+        Variant.objects.create_variant(row=(test_data.new_variant()))
+        new_release()
+        reloaded = index(self.factory.get(
+            '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0&include=Variant_in_ENIGMA'
+            '&include=Variant_in_ClinVar&filter=Gene_Symbol&filterValue=BRCA1'))
+        self.assertEqual(json.loads(reloaded.content)['count'], json.loads(response.content)['count'] + 1)
+
+    def test_index_large_response_not_cached(self):
+        """Responses over the byte limit of the cache are not kept"""
+        url = '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0'
+        with override_settings(CACHED_RESPONSE_MAX_BYTES={'responses': 100}):
+            response = index(self.factory.get(url))
+        self.assertGreater(len(response.content), 100)
+        self.assertEqual(len(caches['responses']._cache), 0)
+
+        index(self.factory.get(url))
+        self.assertEqual(len(caches['responses']._cache), 1)
+
+    def test_index_not_modified(self):
+        """A request carrying the ETag of the current release is answered with 304 before any query"""
+        url = '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0'
+        response = index(self.factory.get(url))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            not_modified = index(self.factory.get(url, HTTP_IF_NONE_MATCH=response['ETag']))
+        self.assertEqual(not_modified.status_code, 304)
+
+        new_release()
+        self.assertEqual(index(self.factory.get(url, HTTP_IF_NONE_MATCH=response['ETag'])).status_code, 200)
+
+    def test_index_count_estimate(self):
+        """count=estimate returns a count from the planner"""
+        request = self.factory.get('/data/?format=json&order_by=Gene_Symbol&page_size=20&count=estimate')
+        response = index(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(json.loads(response.content)['count'], 0)
+
+    def test_index_filter(self):
+        """Filtering on a whitelisted column is a prefix match"""
+        request = self.factory.get(
+            '/data/?format=json&filter=Gene_Symbol&filterValue=BRCA2&order_by=Gene_Symbol&page_size=0&column=Gene_Symbol')
+        response = streamed_json(index(request))
+        self.assertEqual(response['count'], Variant.objects.filter(Gene_Symbol__startswith='BRCA2').count())
+        self.assertTrue(all(row['Gene_Symbol'] == 'BRCA2' for row in response['data']))
+
+    def test_index_frequency_range(self):
+        """Frequency columns are filtered on their parsed number, including rows written after the load"""
+        variant = test_data.new_variant()
+        variant['Max_Allele_Frequency'] = '0.00512 (EUR from ExAC)'
+        created = Variant.objects.create_variant(row=variant)
+
+        def frequency(text):
+            match = re.match(r'\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)', text)
+            return float(match.group(1)) if match else None
+
+        expected = sorted(v.id for v in Variant.objects.all()
+                          if frequency(v.Max_Allele_Frequency) is not None
+                          and 0.001 <= frequency(v.Max_Allele_Frequency) <= 0.01)
+        request = self.factory.get(
+            '/data/?format=json&filter=Max_Allele_Frequency&filterMin=0.001&filterMax=0.01&page_size=0&column=id')
+        response = streamed_json(index(request))
+        self.assertIn(created.id, expected)
+        self.assertEqual(response['count'], len(expected))
+        self.assertEqual(sorted(row['id'] for row in response['data']), expected)
+
+        request = self.factory.get('/data/?format=json&filter=Max_Allele_Frequency&filterMax=abc&page_size=20')
+        self.assertEqual(index(request).status_code, 400)
+
+        # without bounds the filter is the prefix match on the text, as before the ranges
+        request = self.factory.get('/data/?format=json&filter=Max_Allele_Frequency&filterValue=0.00512'
+                                   '&filter=Gene_Symbol&filterValue=BRCA&page_size=0&column=id')
+        response = streamed_json(index(request))
+        expected = Variant.objects.filter(Max_Allele_Frequency__startswith='0.00512', Gene_Symbol__startswith='BRCA')
+        self.assertIn(created.id, [row['id'] for row in response['data']])
+        self.assertEqual(response['count'], expected.count())
+
+        for query in ('filter=Max_Allele_Frequency', 'filter=Max_Allele_Frequency&filterMin=&filterMax='):
+            request = self.factory.get('/data/?format=json&{}&page_size=20'.format(query))
+            self.assertEqual(index(request).status_code, 400)
+
+    def test_index_filter_unknown_column(self):
+        """Filtering on a column that isn't whitelisted is rejected"""
+        request = self.factory.get('/data/?format=json&filter=Synonyms&filterValue=x&page_size=20')
+        response = index(request)
+        self.assertEqual(response.status_code, 400)
+
+    def test_lollipop(self):
+        """The lollipop endpoint returns the plotted columns of the matching variants as arrays"""
+        request = self.factory.get(
+            '/data/?format=json&filter=Gene_Symbol&filterValue=BRCA1&page_size=0'
+            '&column=id&column=Genomic_Coordinate_hg38&column=Pathogenicity_default')
+        rows = sorted(streamed_json(index(request))['data'], key=lambda row: row['id'])
+
+        request = self.factory.get('/data/lollipop/?filter=Gene_Symbol&filterValue=BRCA1')
+        columns = json.loads(lollipop(request).content)
+        self.assertEqual(sorted(columns.keys()), ['Genomic_Coordinate_hg38', 'Pathogenicity_default', 'id'])
+        self.assertEqual(sorted(zip(columns['id'], columns['Genomic_Coordinate_hg38'], columns['Pathogenicity_default'])),
+                         [(row['id'], row['Genomic_Coordinate_hg38'], row['Pathogenicity_default']) for row in rows])
+
+    def test_lollipop_cache(self):
+        """Lollipop responses are cached apart from the variant listing, which can't evict them"""
+        request = self.factory.get('/data/lollipop/?filter=Gene_Symbol&filterValue=BRCA1')
+        content = lollipop(request).content
+        self.assertEqual(len(caches['lollipop']._cache), 1)
+
+        # more entries than the responses cache holds
+        for key in range(1000):
+            caches['responses'].set('page:{}'.format(key), key)
+        self.assertEqual(len(caches['lollipop']._cache), 1)
+        self.assertEqual(lollipop(request).content, content)
+
+    def test_index_columns_layout(self):
+        """layout=columns returns the same rows as lists under the requested column order"""
+        url = '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0&column=id&column=HGVS_cDNA'
+        rows = json.loads(index(self.factory.get(url)).content)['data']
+        response = json.loads(index(self.factory.get(url + '&layout=columns')).content)
+
+        self.assertEqual(response['columns'], ['id', 'HGVS_cDNA'])
+        self.assertEqual(response['rows'], [[row['id'], row['HGVS_cDNA']] for row in rows])
+        self.assertEqual(response['count'], self.db_size)
+
+        url = '/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0&column=HGVS_cDNA&column=id&layout=columns'
+        response = json.loads(index(self.factory.get(url)).content)
+        self.assertEqual(response['columns'], ['HGVS_cDNA', 'id'])
+        self.assertEqual(response['rows'], [[row['HGVS_cDNA'], row['id']] for row in rows])
+
+    def test_index_unpaged_streams(self):
+        """page_size=0 streams every row, as objects or in the columns layout"""
+        url = '/data/?format=json&order_by=Gene_Symbol&page_size=0&column=id&column=Gene_Symbol'
+        response = index(self.factory.get(url))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        # small batches so the rows span several fetches
+        with override_settings(EXPORT_FETCH_SIZE=7):
+            body = streamed_json(response)
+            columns = streamed_json(index(self.factory.get(url + '&layout=columns')))
+
+        expected = list(Variant.objects.order_by('Gene_Symbol').values('id', 'Gene_Symbol'))
+        self.assertEqual(body['count'], self.db_size)
+        self.assertEqual(sorted(body['data']), sorted(expected))
+        self.assertEqual([row['Gene_Symbol'] for row in body['data']], [row['Gene_Symbol'] for row in expected])
+        self.assertEqual(columns['columns'], ['id', 'Gene_Symbol'])
+        self.assertEqual([dict(zip(columns['columns'], row)) for row in columns['rows']], body['data'])
+
+    def test_serializer_matches_json(self):
+        """The selected encoder produces the same JSON as the json module, dates through jsonable"""
+        page = streamed_json(index(self.factory.get('/data/?format=json&page_size=0&page_num=0')))
+        self.assertEqual(json.loads(dumps(page)), json.loads(json_dumps(page)))
+
+        release = new_release()
+        self.assertEqual(json.loads(dumps(jsonable({'loaded_at': release.loaded_at}))),
+                         json.loads(json_dumps({'loaded_at': release.loaded_at})))
+
+    @unittest.skipUnless(ujson_installed, 'ujson is not installed')
+    def test_serializer_uses_ujson(self):
+        """ujson is the encoder when it is installed"""
+        self.assertEqual(encoder_name, 'ujson')
+
+    def test_index_keyset_pages(self):
+        """Following the next cursor walks the variants in (order_by, id) order without gaps"""
+        expected = list(Variant.objects.order_by('-Gene_Symbol', '-id').values_list('id', flat=True)[:40])
+
+        request = self.factory.get(
+            '/data/?format=json&order_by=Gene_Symbol&direction=descending&page_size=20&after=&column=id')
+        first_page = json.loads(index(request).content)
+        self.assertEqual(first_page['count'], self.db_size)
+        self.assertEqual([row['id'] for row in first_page['data']], expected[:20])
+        self.assertEqual(first_page['data'][0].keys(), ['id'])
+
+        request = self.factory.get(
+            '/data/?format=json&order_by=Gene_Symbol&direction=descending&page_size=20&column=id&after=%s'
+            % first_page['next'])
+        second_page = json.loads(index(request).content)
+        self.assertEqual([row['id'] for row in second_page['data']], expected[20:40])
+
+        # the count is of every match, not of the rows after the cursor, also when it isn't already cached
+        cache.clear()
+        caches['responses'].clear()
+        self.assertEqual(json.loads(index(request).content)['count'], self.db_size)
+        # and the count cached by a deep page is the one of the numbered pages
+        numbered = self.factory.get('/data/?format=json&order_by=Gene_Symbol&page_size=20&page_num=0&column=id')
+        self.assertEqual(json.loads(index(numbered).content)['count'], self.db_size)
+        estimate = self.factory.get(request.get_full_path() + '&count=estimate')
+        first_estimate = self.factory.get(
+            '/data/?format=json&order_by=Gene_Symbol&direction=descending&page_size=20&after=&column=id&count=estimate')
+        self.assertEqual(json.loads(index(estimate).content)['count'],
+                         json.loads(index(first_estimate).content)['count'])
+
+    def test_index_keyset_invalid_cursor(self):
+        """A cursor that can't be decoded is rejected"""
+        request = self.factory.get('/data/?format=json&order_by=Gene_Symbol&page_size=20&after=garbage')
+        response = index(request)
+        self.assertEqual(response.status_code, 400)
+
     #@unittest.skip("Not Passing")
     def test_autocomplete_nucleotide(self):
         """Getting autocomplete suggestions for words starting with c.2123 should return 2 results"""
@@ -93,6 +490,59 @@ class VariantTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertJSONEqual(response.content, {"suggestions": expected_autocomplete_results})
 
+    @override_settings(SUGGESTIONS_IN_MEMORY=False)
+    def test_autocomplete_database(self):
+        """Suggestions from the database match the in-memory suggestions"""
+        request = self.factory.get('/data/suggestions/?term=%s' % quote('c.2123'))
+        response = autocomplete(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertJSONEqual(response.content, {"suggestions": [["c.2123c>a"], ["c.2123c>t"]]})
+
+    def test_autocomplete_ranked(self):
+        """Suggestions are ranked by the number of variants the word occurs in, in memory and in the database"""
+        cursor = connection.cursor()
+        for term in ('b', 'c.', 'c.21', 'ivs7+10'):
+            request = self.factory.get('/data/suggestions/?term=%s&limit=5' % quote(term))
+            suggestions = [word for [word] in json.loads(autocomplete(request).content)['suggestions']]
+            with self.settings(SUGGESTIONS_IN_MEMORY=False):
+                self.assertEqual(json.loads(autocomplete(request).content)['suggestions'], [[w] for w in suggestions])
+
+            cursor.execute("SELECT word, frequency FROM words WHERE word LIKE %s", [term + '%'])
+            expected = sorted(cursor.fetchall(), key=lambda (word, frequency): (-frequency, word))[:5]
+            self.assertEqual(suggestions, [word for word, _ in expected])
+
+    def test_autocomplete_limit(self):
+        """No more than limit suggestions are returned"""
+        request = self.factory.get('/data/suggestions/?term=c.&limit=3')
+        suggestions = json.loads(autocomplete(request).content)['suggestions']
+
+        self.assertEqual(len(suggestions), 3)
+        self.assertTrue(all(word.startswith('c.') for [word] in suggestions))
+
+        # limit is capped, so the kept results of short terms stay small
+        cursor = connection.cursor()
+        cursor.execute("SELECT count(*) FROM words WHERE word LIKE %s", ['c.%'])
+        request = self.factory.get('/data/suggestions/?term=c.&limit=100000')
+        self.assertEqual(len(json.loads(autocomplete(request).content)['suggestions']),
+                         min(cursor.fetchone()[0], MAX_SUGGESTIONS))
+
+    def test_autocomplete_kept_results(self):
+        """Only short terms that start some word have their results kept, once for every limit"""
+        word_index.release = None  # reloaded with nothing kept
+        for term, limit in (('c.', 3), ('c.', 7), (u'\u2603', 5), ('zq', 5)):
+            autocomplete(self.factory.get(
+                '/data/suggestions/?term=%s&limit=%d' % (quote(term.encode('utf-8')), limit)))
+        self.assertEqual(word_index.index[2].keys(), ['c.'])
+
+    def test_autocomplete_no_term(self):
+        """Without a term the most frequent words are suggested, in memory and in the database"""
+        request = self.factory.get('/data/suggestions/?limit=3')
+        suggestions = json.loads(autocomplete(request).content)['suggestions']
+        self.assertEqual(len(suggestions), 3)
+        with self.settings(SUGGESTIONS_IN_MEMORY=False):
+            self.assertEqual(json.loads(autocomplete(request).content)['suggestions'], suggestions)
+
 ###################################################################################
 ############################# NEW TESTS START #####################################
     def test_ga4gh_variants_status_code(self):
@@ -129,6 +579,11 @@ class VariantTestCase(TestCase):
         jresponse = json.dumps(json_format._MessageToJsonObject(brca_to_ga4gh(resp), False))
         self.assertJSONEqual(jresponse , expectedResp)
 
+    def test_ga4gh_json(self):
+        """The directly built GA4GH JSON is what json_format makes of the protobuf message"""
+        for row in Variant.objects.values(*VARIANT_FIELDS)[:20]:
+            self.assertEqual(ga4gh_json(row), json_format._MessageToJsonObject(brca_to_ga4gh(row), True))
+
     def test_validated_request(self):
         request = v_s.SearchVariantsRequest()
         req = self.factory.post("/data/ga4gh/variants/search", json.dumps(json_format._MessageToJsonObject(request, False)),
@@ -154,6 +609,22 @@ class VariantTestCase(TestCase):
         response = index_num_2(req)
         self.assertJSONEqual(response.content, ErrorMessages['end'])
 
+    def test_ga4gh_region_search(self):
+        """variants/search returns the variants in [start, end) of the reference, in position order"""
+        start, end = 41245000, 41250000
+        request = self.factory.post("/data/ga4gh/variants/search", json.dumps(
+            {"variantSetId": "brca1", "referenceName": "chr17", "start": start, "end": end, "pageSize": 1000}),
+            content_type="application/json")
+        variants = json.loads(index_num_2(request).content)["variants"]
+
+        expected = []
+        for variant in Variant.objects.filter(Genomic_Coordinate_hg37__startswith='chr17:'):
+            position = int(variant.Genomic_Coordinate_hg37.split(':')[1])
+            if start <= position < end:
+                expected.append((position, variant.id))
+        self.assertTrue(expected)
+        self.assertEqual([(int(v["start"]), int(v["id"])) for v in variants], sorted(expected))
+
     def test_offset_calculator(self):
         start = 12500
         end = 13000
@@ -166,20 +637,29 @@ class VariantTestCase(TestCase):
         self.assertEquals(e2, s2+2)
 
     def test_pagging_token(self):
-        request0 = self.factory.post(
-            "/data/ga4gh/variants/search", json.dumps(
-                {"end": 51425158029, "referenceName": "chr17", "variantSetId": "brca1", "start": 51425158,
-                 "pageSize": 5}), content_type="application/json")
-        response = index_num_2(request0)
-        self.assertEqual(json.loads(response.content)["nextPageToken"], "1" )
-
-        request0 = self.factory.post(
-            "/data/ga4gh/variants/search", json.dumps(
-                {"end": 51425158029, "referenceName": "chr17", "variantSetId": "brca1", "start": 51425158,
-                 "pageSize": 5, "pageToken": "3"}), content_type="application/json", )
-        response = index_num_2(request0)
-        self.assertEqual(json.loads(response.content)["nextPageToken"], "4")
-        self.assertEquals(len(json.loads(response.content)["variants"]), 5)
+        """Following nextPageToken walks the region in position order without gaps, the last page has no token"""
+        def search(page_size, page_token=None):
+            query = {"end": 41250000, "referenceName": "chr17", "variantSetId": "brca1", "start": 41245000,
+                     "pageSize": page_size}
+            if page_token:
+                query["pageToken"] = page_token
+            request = self.factory.post("/data/ga4gh/variants/search", json.dumps(query), content_type="application/json")
+            return json.loads(index_num_2(request).content)
+
+        everything = search(10000)
+        self.assertEqual(everything["nextPageToken"], "")
+        self.assertGreater(len(everything["variants"]), 10)
+
+        pages = [search(5)]
+        while pages[-1]["nextPageToken"]:
+            pages.append(search(5, pages[-1]["nextPageToken"]))
+        self.assertTrue(all(len(page["variants"]) == 5 for page in pages[:-1]))
+        self.assertEqual([variant["id"] for page in pages for variant in page["variants"]],
+                         [variant["id"] for variant in everything["variants"]])
+
+        self.assertEqual(search(5, "not a token"), ErrorMessages['pageToken'])
+        self.assertEqual(search(0), ErrorMessages['pageSize'])
+        self.assertEqual(search(-3), ErrorMessages['pageSize'])
 
     def test_get_variant_response(self):
         request = self.factory.get("/data/ga4gh/variants/hg37-1")
@@ -188,6 +668,38 @@ class VariantTestCase(TestCase):
         self.assertEqual(jsonresp["referenceName"], "chr13")
         self.assertEqual(jsonresp["start"], "32923951")
 
+    def test_ga4gh_protobuf(self):
+        """Accept: application/x-protobuf gets the serialized messages the JSON is made from"""
+        body = json.dumps({"end": 41277500, "referenceName": "chr17", "variantSetId": "brca1", "start": 41196311,
+                           "pageSize": 5})
+        variants = json.loads(index_num_2(self.factory.post(
+            "/data/ga4gh/variants/search", body, content_type="application/json")).content)["variants"]
+        response = index_num_2(self.factory.post(
+            "/data/ga4gh/variants/search", body, content_type="application/json",
+            HTTP_ACCEPT="application/x-protobuf"))
+        self.assertEqual(response['Content-Type'], "application/x-protobuf")
+        message = v_s.SearchVariantsResponse.FromString(response.content)
+        self.assertEqual([variant.id for variant in message.variants], [variant["id"] for variant in variants])
+        self.assertEqual(message.next_page_token, json.loads(index_num_2(self.factory.post(
+            "/data/ga4gh/variants/search", body, content_type="application/json")).content)["nextPageToken"])
+
+        json_response = get_var_by_id(self.factory.get("/data/ga4gh/variants/hg37-1"), "hg37-1")
+        request = self.factory.get("/data/ga4gh/variants/hg37-1", HTTP_ACCEPT="application/protobuf")
+        response = get_var_by_id(request, "hg37-1")
+        self.assertEqual(json_format._MessageToJsonObject(vrs.Variant.FromString(response.content), True),
+                         json.loads(json_response.content))
+        self.assertNotEqual(response['ETag'], json_response['ETag'])
+
+        request = self.factory.get("/data/ga4gh/variantsets/brca-hg37", HTTP_ACCEPT="application/x-protobuf")
+        message = vrs.VariantSet.FromString(get_varset_by_id(request, "brca-hg37").content)
+        self.assertEqual(message.id, "brca-hg37")
+
+    def test_get_variant_not_modified(self):
+        request = self.factory.get("/data/ga4gh/variants/hg37-1")
+        response = get_var_by_id(request, "hg37-1")
+        request = self.factory.get("/data/ga4gh/variants/hg37-1", HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(get_var_by_id(request, "hg37-1").status_code, 304)
+
     def test_brca_to_ga4gh_variantSets_status_code(self):
         request0 = self.factory.post(
             "/data/ga4gh/variants/search", json.dumps({"datasetId": "hg37"}), content_type="application/json")
@@ -215,6 +727,22 @@ class VariantTestCase(TestCase):
         self.assertEquals(json.loads(response.content)["nextPageToken"], '0')
 
 
+    def test_prepared_variant_sets(self):
+        """The prepared variant set responses are the messages built for the request"""
+        expected = v_s.SearchVariantSetsResponse()
+        expected.next_page_token = "2"
+        expected.variant_sets.extend([variant_set("brca", "hg38")])
+
+        body = json.dumps({"datasetId": "hg38", "pageToken": "2"})
+        response = get_variantSet(self.factory.post("/data/ga4gh/variantsets/search", body, content_type="application/json"))
+        self.assertEqual(json.loads(response.content), json_format._MessageToJsonObject(expected, True))
+        response = get_variantSet(self.factory.post("/data/ga4gh/variantsets/search", body,
+                                                    content_type="application/json", HTTP_ACCEPT="application/x-protobuf"))
+        self.assertEqual(v_s.SearchVariantSetsResponse.FromString(response.content), expected)
+
+        response = get_varset_by_id(self.factory.get("/data/ga4gh/variantsets/brca-hg38"), "brca-hg38")
+        self.assertEqual(json.loads(response.content), json_format._MessageToJsonObject(variant_set("brca", "hg38"), False))
+
     def test_get_variantSet_by_id(self):
         request = self.factory.get("/data/ga4gh/variantsets/brca-hg37")
         response = get_varset_by_id(request, "brca-hg37")
@@ -1,24 +1,40 @@
-import os
 import re
-import tempfile
 import json
+import base64
+import threading
+from Queue import Queue
+from itertools import izip_longest
 from operator import __or__
 
-from django.db import connection
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, transaction
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.gzip import gzip_page
 
+from brca.serializers import JsonResponse, dumps
+
+from .caching import cached, cached_response, release_etag, release_last_modified
+from .loaders import FREQUENCY_COLUMNS, numeric_column, coordinate_columns
 from .models import Variant
+from .suggestions import word_index, RANKED_PREFIX_LENGTH, MAX_SUGGESTIONS
 #########################################################
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.vary import vary_on_headers
 from ga4gh import variant_service_pb2 as v_s
 from ga4gh import variants_pb2 as vrs
 import google.protobuf.json_format as json_format
 
 #########################################################
 
+# Every column of a variant, in table order
+VARIANT_FIELDS = [field.name for field in Variant._meta.concrete_fields]
+
+
+@condition(etag_func=release_etag, last_modified_func=release_last_modified)
 @gzip_page
+@cached_response
 def index(request):
     order_by = request.GET.get('order_by')
     direction = request.GET.get('direction')
@@ -26,58 +42,128 @@ def index(request):
     page_num = int(request.GET.get('page_num', '0'))
     search_term = request.GET.get('search_term')
     format = request.GET.get('format')
-    include = request.GET.getlist('include')
-    exclude = request.GET.getlist('exclude')
-    filters = request.GET.getlist('filter')
-    filter_values = request.GET.getlist('filterValue')
     column = request.GET.getlist('column')
-
-    query = Variant.objects
+    # keyset paging: an empty 'after' asks for the first page, later pages pass back 'next'
+    after = request.GET.get('after')
+    # 'estimate' takes the counts from the planner statistics instead of counting rows
+    count_mode = request.GET.get('count')
+    # 'columns' returns the rows as lists under a single list of column names instead of as objects
+    layout = request.GET.get('layout')
+
+    query = filtered_variants(request)
+    if isinstance(query, HttpResponse):
+        return query
+
+    # the rows counted, before a keyset page seeks past the previous pages
+    matches = query
+
+    if after is not None and format == 'json':
+        try:
+            query, key = apply_keyset(query, order_by, direction, after)
+        except (FieldDoesNotExist, TypeError, ValueError):
+            return JsonResponse({'error code': 400, 'message': 'invalid after cursor or order_by'}, status=400)
+    elif order_by:
+        query = apply_order(query, order_by, direction)
 
     if format == 'csv':
-        quotes = '\''
-    else:
-        quotes = ''
 
-    if include or exclude:
-        query = apply_sources(query, include, exclude)
+        response = StreamingHttpResponse(stream_csv(query), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment;filename="variants.csv"'
+        return response
 
-    if filters:
-        query = apply_filters(query, filter_values, filters, quotes=quotes)
+    elif format == 'json':
 
-    if search_term:
-        query = apply_search(query, search_term, quotes=quotes)
+        if count_mode == 'estimate':
+            count, synonyms = estimate_counts(matches, search_term)
+        else:
+            # keyed on the query that is counted, so a count can only be reused for the same matches
+            count_params = list(matches.order_by().query.sql_with_params())
+            count, synonyms = cached('count', count_params, lambda: count_matches(matches, search_term))
+
+        body = {'count': count, 'synonyms': synonyms}
+
+        if not page_size and after is None:
+            # the whole result set is streamed from a server-side cursor instead of being built in memory
+            column = column or VARIANT_FIELDS
+            if layout == 'columns':
+                body['columns'] = column
+                rows = stream_json(query.values_list(*column), body, 'rows')
+            else:
+                rows = stream_json(query.values_list(*column), body, 'data', names=column)
+            response = StreamingHttpResponse(rows, content_type='application/json')
+            response['Access-Control-Allow-Origin'] = '*'
+            return response
 
-    if order_by:
-        query = apply_order(query, order_by, direction)
+        if layout == 'columns':
+            # the column names are sent once and every row is a list of values in that order
+            body['columns'] = column = column or VARIANT_FIELDS
+            if after is not None:
+                data, body['next'] = select_page_after(query, page_size, column, key)
+                body['rows'] = [[row[c] for c in column] for row in data]
+            else:
+                body['rows'] = list(select_page(query, page_size, page_num).values_list(*column))
+        elif after is not None:
+            body['data'], body['next'] = select_page_after(query, page_size, column, key)
+        else:
+            query = select_page(query, page_size, page_num)
 
-    if format == 'csv':
+            # call list() now to evaluate the query
+            body['data'] = list(query.values(*column))
 
-        cursor = connection.cursor()
-        with tempfile.NamedTemporaryFile() as f:
-            os.chmod(f.name, 0606)
-            cursor.execute("COPY ({}) TO '{}' WITH DELIMITER ',' CSV HEADER".format(query.query, f.name))
+        response = JsonResponse(body)
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
 
-            response = HttpResponse(f.read(), content_type='text/csv')
-            response['Content-Disposition'] = 'attachment;filename="variants.csv"'
-            return response
 
-    elif format == 'json':
+# The columns the lollipop chart plots
+LOLLIPOP_COLUMNS = ('id', 'Genomic_Coordinate_hg38', 'Pathogenicity_default')
 
-        count = query.count()
 
-        if search_term:
-            # Number of synonym matches = total matches minus matches on "normal" columns
-            synonyms = count - apply_search(query, search_term, search_column='fts_standard').count()
-        else:
-            synonyms = 0
+@condition(etag_func=release_etag, last_modified_func=release_last_modified)
+@gzip_page
+@cached_response(cache_alias='lollipop')
+def lollipop(request):
+    # All the matching variants as one array per column, without counts or ordering.
+    # The chart is drawn per gene, so most requests are the cached response for a Gene_Symbol filter,
+    # kept in a cache of their own where the many variant listing pages can't evict them.
+    query = filtered_variants(request)
+    if isinstance(query, HttpResponse):
+        return query
+
+    columns = zip(*query.values_list(*LOLLIPOP_COLUMNS)) or [()] * len(LOLLIPOP_COLUMNS)
+    response = JsonResponse(dict(zip(LOLLIPOP_COLUMNS, columns)))
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
 
-        query = select_page(query, page_size, page_num)
 
-        # call list() now to evaluate the query
-        response = JsonResponse({'count': count, 'synonyms': synonyms, 'data': list(query.values(*column))})
-        response['Access-Control-Allow-Origin'] = '*'
-        return response
+def filtered_variants(request):
+    """The variants matching the sources, filters and search term of the request, shared by the index and
+    lollipop views, or a 400 response for an invalid filter"""
+    search_term = request.GET.get('search_term')
+    include = request.GET.getlist('include')
+    exclude = request.GET.getlist('exclude')
+    filters = request.GET.getlist('filter')
+    filter_values = request.GET.getlist('filterValue')
+    filter_mins = request.GET.getlist('filterMin')
+    filter_maxes = request.GET.getlist('filterMax')
+
+    query = Variant.objects
+
+    if include or exclude:
+        query = apply_sources(query, include, exclude)
+
+    try:
+        conditions = filter_conditions(filters, filter_values, filter_mins, filter_maxes)
+    except ValueError as e:
+        return JsonResponse({'error code': 400, 'message': 'invalid filter column {}'.format(e)}, status=400)
+
+    if conditions:
+        query = apply_filters(query, conditions)
+
+    if search_term:
+        query = apply_search(query, search_term)
+
+    return query
 
 
 def apply_sources(query, include, exclude):
@@ -89,38 +175,185 @@ def apply_sources(query, include, exclude):
     return query.filter(reduce(__or__, include_list)).filter(**exclude_dict)
 
 
-def apply_filters(query, filterValues, filters, quotes=''):
+def filter_conditions(filters, filterValues, filterMins=(), filterMaxes=()):
+    """Pair every filter column with its value, or with its (min, max) bounds for a frequency column.
+    Values are matched up with the other filters and bounds with the frequency filters by position,
+    an empty bound leaves that end of the range open. A frequency filter left without bounds takes
+    the next value instead, as a prefix like the other columns, and is invalid without either."""
+    values = iter(filterValues)
+    bounds = izip_longest(filterMins, filterMaxes, fillvalue='')
+    conditions = []
+    for column in filters:
+        if column in FREQUENCY_COLUMNS:
+            low, high = next(bounds, (None, None))
+            if low is None:
+                value = next(values, None)
+                if value is None:
+                    raise ValueError('{} (no filterValue, filterMin or filterMax)'.format(column))
+                conditions.append((column, value))
+                continue
+            low, high = parse_bound(column, low), parse_bound(column, high)
+            if low is None and high is None:
+                raise ValueError('{} (empty filterMin and filterMax)'.format(column))
+            conditions.append((column, (low, high)))
+        elif column == 'id' or column in FILTER_COLUMNS:
+            value = next(values, None)
+            if value is not None:
+                conditions.append((column, value))
+        else:
+            raise ValueError(column)
+    return conditions
+
+
+def parse_bound(column, bound):
+    if bound == '':
+        return None
+    try:
+        return float(bound)
+    except ValueError:
+        raise ValueError('{} (bound {!r} is not a number)'.format(column, bound))
+
+
+def apply_filters(query, conditions):
     # if there are multiple filters the row must match all the filters
-    for column, value in zip(filters, filterValues):
+    for column, value in conditions:
         if column == 'id':
             query = query.filter(**{column: value})
+        elif column in FREQUENCY_COLUMNS and isinstance(value, tuple):
+            # range scan on the parsed copy of the column, variants without a frequency never match
+            low, high = value
+            if low is not None:
+                query = query.extra(where=["\"{}\" >= %s".format(numeric_column(column))], params=[low])
+            if high is not None:
+                query = query.extra(where=["\"{}\" <= %s".format(numeric_column(column))], params=[high])
         else:
+            # prefix match, served by the column's text_pattern_ops index
             query = query.extra(
                 where=["\"{0}\" LIKE %s".format(column)],
-                params=["{0}{1}%{0}".format(quotes, value)]
+                params=[escape_like(value) + '%']
             )
     return query
 
 
-def apply_search(query, search_term, search_column='fts_document', quotes=''):
+# Columns the variant table can be filtered on, each has a text_pattern_ops index (see 0007_filter_indexes).
+# The loaders' FREQUENCY_COLUMNS can be filtered on a range with filterMin and filterMax instead of filterValue.
+FILTER_COLUMNS = ('Gene_Symbol', 'Pathogenicity_default', 'Clinical_significance_ENIGMA')
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def apply_search(query, search_term, search_column='fts_document'):
     # search using the tsvector column which represents our document made of all the columns
     where_clause = "variant.{} @@ to_tsquery('simple', %s)".format(search_column)
-    parameter = quotes + sanitise_term(search_term) + quotes
     return query.extra(
         where=[where_clause],
-        params=[parameter]
+        params=[sanitise_term(search_term)]
     )
 
 
-def apply_order(query, order_by, direction):
+def count_matches(query, search_term):
+    if not search_term:
+        return query.count(), 0
+
+    # Number of synonym matches = total matches minus matches on "normal" columns,
+    # both are counted in a single pass over the search results
+    matches = query.order_by().extra(
+        select={'standard_match': "variant.fts_standard @@ to_tsquery('simple', %s)"},
+        select_params=[sanitise_term(search_term)]
+    ).values('standard_match')
+    sql, params = matches.query.sql_with_params()
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT COUNT(*), COUNT(*) FILTER (WHERE NOT standard_match) FROM ({}) AS matches".format(sql),
+        params)
+    count, synonyms = cursor.fetchone()
+    return count, synonyms
+
+
+def estimate_counts(query, search_term):
+    count = estimate_count(query)
+
+    if search_term:
+        synonyms = max(0, count - estimate_count(apply_search(query, search_term, search_column='fts_standard')))
+    else:
+        synonyms = 0
+    return count, synonyms
+
+
+def estimate_count(query):
+    # the planner's row estimate for the query, from the table statistics kept up to date by ANALYZE
+    sql, params = query.order_by().query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def order_column(order_by):
     # special case for HGVS columns
     if order_by in ('HGVS_cDNA', 'HGVS_Protein'):
-        order_by = 'Genomic_Coordinate_hg38'
+        return 'Genomic_Coordinate_hg38'
+    return order_by
+
+
+def apply_order(query, order_by, direction):
+    order_by = order_column(order_by)
     if direction == 'descending':
         order_by = '-' + order_by
     return query.order_by(order_by, 'Pathogenicity_default')
 
 
+def apply_keyset(query, order_by, direction, after):
+    # order on the sort column with id as a tiebreaker so every row has a unique position,
+    # then seek past the last row of the previous page instead of using OFFSET
+    column = order_column(order_by) if order_by else 'id'
+    Variant._meta.get_field(column)
+    key = ['id'] if column == 'id' else [column, 'id']
+    descending = direction == 'descending'
+
+    query = query.order_by(*[('-' if descending else '') + k for k in key])
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(key):
+            raise ValueError(after)
+        where_clause = "({}) {} ({})".format(
+            ', '.join('"variant"."{}"'.format(k) for k in key),
+            '<' if descending else '>',
+            ', '.join(['%s'] * len(key)))
+        query = query.extra(where=[where_clause], params=values)
+    return query, key
+
+
+def select_page_after(query, page_size, column, key):
+    # the key columns are needed to build the next cursor even when the client didn't ask for them
+    extra_columns = [k for k in key if column and k not in column]
+    query = query.values(*(column + extra_columns))
+    if page_size:
+        query = query[:page_size]
+    data = list(query)
+
+    next_cursor = None
+    if page_size and len(data) == page_size:
+        next_cursor = encode_cursor([data[-1][k] for k in key])
+    for row in data:
+        for k in extra_columns:
+            del row[k]
+    return data, next_cursor
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(str(cursor)))
+
+
 def select_page(query, page_size, page_num):
     if page_size:
         start = page_size * page_num
@@ -129,22 +362,134 @@ def select_page(query, page_size, page_num):
     return query
 
 
-def autocomplete(request):
-    term = request.GET.get('term')
-    limit = int(request.GET.get('limit', 10))
-
+def stream_json(query, head, rows_key, names=None):
+    """Yield the JSON object head with the rows of the values_list query under rows_key,
+    encoded a batch at a time. With names every row is encoded as an object instead of a list."""
+    yield dumps(head)[:-1] + ',{}:['.format(json.dumps(rows_key))
+    separator = ''
+    for rows in fetch_batches(query, 'stream_json'):
+        if names:
+            rows = [dict(zip(names, row)) for row in rows]
+        yield separator + dumps(rows)[1:-1]
+        separator = ','
+    yield ']}'
+
+
+def fetch_batches(query, name='export'):
+    """Yield the rows of the values_list query in lists of settings.EXPORT_FETCH_SIZE, read through
+    a server-side cursor so that only one batch at a time is held by the worker"""
+    sql, params = query.query.sql_with_params()
+
+    # a named cursor only lives inside a transaction
+    with transaction.atomic():
+        cursor = connection.connection.cursor(name=name)
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(settings.EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def fetch_values(query, fields):
+    """The rows of query as dicts of fields, read in batches through a server-side cursor"""
+    for rows in fetch_batches(query.values_list(*fields), 'fetch_values'):
+        for row in rows:
+            yield dict(zip(fields, row))
+
+
+# chunks of the CSV export waiting for the client, at most
+CSV_QUEUE_SIZE = 16
+
+
+class QueueWriter(object):
+    # file-like object handed to copy_expert, COPY TO writes it once per row, the rows are
+    # passed on to the response in chunks of at least chunk_size bytes
+    def __init__(self, queue, chunk_size):
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.queue.put(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+
+def stream_csv(query):
+    # COPY ... TO STDOUT runs in a worker thread and hands chunks over a bounded queue,
+    # so the export never touches the filesystem and never sits in memory as a whole
     cursor = connection.cursor()
+    sql, params = query.query.sql_with_params()
+    copy_sql = cursor.mogrify("COPY ({}) TO STDOUT WITH DELIMITER ',' CSV HEADER".format(sql), params)
+    chunks = Queue(maxsize=CSV_QUEUE_SIZE)
+
+    def copy():
+        try:
+            writer = QueueWriter(chunks, settings.EXPORT_COPY_CHUNK_SIZE)
+            cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+
+    worker = threading.Thread(target=copy)
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        if worker.is_alive():
+            # the client went away: stop the COPY and unblock the worker
+            cursor.connection.cancel()
+            while worker.is_alive():
+                while not chunks.empty():
+                    chunks.get()
+                worker.join(0.1)
+        cursor.close()
 
-    cursor.execute(
-        """SELECT word FROM words
-        WHERE word LIKE %s
-        AND char_length(word) >= 3
-        ORDER BY word""",
-        ["%s%%" % term])
 
-    rows = cursor.fetchall()
+def autocomplete(request):
+    term = request.GET.get('term', '')
+    limit = max(0, min(int(request.GET.get('limit', 10)), MAX_SUGGESTIONS))
 
-    response = JsonResponse({'suggestions': rows[:limit]})
+    # suggestions are ranked by the number of variants the word occurs in
+    if settings.SUGGESTIONS_IN_MEMORY:
+        rows = [[word] for word in word_index.suggest(term, limit)]
+    else:
+        cursor = connection.cursor()
+        if len(term) <= RANKED_PREFIX_LENGTH:
+            # an index-only scan of words_prefix_<n>_idx in rank order, stopped by the LIMIT
+            cursor.execute(
+                """SELECT word FROM words WHERE left(word, {0}) = %s
+                ORDER BY left(word, {0}), frequency DESC, word COLLATE "C" LIMIT %s""".format(len(term)),
+                [term, limit])
+        else:
+            # longer terms match few words, they are found through words_idx and then ranked
+            cursor.execute(
+                """SELECT word FROM words WHERE word LIKE %s
+                ORDER BY frequency DESC, word COLLATE "C" LIMIT %s""",
+                [escape_like(term) + '%', limit])
+        rows = cursor.fetchall()
+
+    response = JsonResponse({'suggestions': rows})
     response['Access-Control-Allow-Origin'] = '*'
     return response
 
@@ -162,6 +507,7 @@ def sanitise_term(term):
 
 end_index = None
 @require_http_methods(["POST"])
+@vary_on_headers('Accept')
 def index_num_2(request):
     conditional = validate_request(request)
     if conditional :
@@ -176,27 +522,67 @@ def index_num_2(request):
         page_size = req_dict.get('pageSize', 1)
         page_token = req_dict.get('pageToken', "0")
 
-    response0 = v_s.SearchVariantsResponse()
+    try:
+        after = page_key(page_token, str(reference_name))
+    except (TypeError, ValueError):
+        return JsonResponse(ErrorMessages['pageToken'])
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        page_size = 0
+    if page_size <= 0:
+        return JsonResponse(ErrorMessages['pageSize'])
+
+    # the region is in the coordinates the variants report as their start
+    DbResp = search_region(Variant.objects, str(reference_name), int(start), int(end))
+    ret_data = ga4gh_brca_page(DbResp, page_size, after)
+    rows = list(fetch_values(ret_data, VARIANT_FIELDS + ['position']))
+    # the next page starts after the last returned variant, there is no token after the last page
+    page_token = ''
+    if len(rows) > page_size:
+        rows.pop()
+        page_token = encode_cursor([str(reference_name), rows[-1]['position'], rows[-1]['id']])
+    for row in rows:
+        del row['position']
+    content_type = protobuf_type(request)
+    if content_type:
+        response0 = v_s.SearchVariantsResponse()
+        response0.variants.extend(brca_to_ga4gh(row) for row in rows)
+        response0.next_page_token = str(page_token)
+        return protobuf_response(response0, content_type)
+    # the JSON of a SearchVariantsResponse with default values included
+    return JsonResponse({'variants': [ga4gh_json(row) for row in rows], 'nextPageToken': str(page_token)})
+
+# GA4GH variants are given on hg37, regions are searched on its parsed coordinates (see 0012_coordinate_columns)
+GA4GH_CHROMOSOME, GA4GH_POSITION, _, _ = coordinate_columns('hg37')
+
+
+def search_region(query, reference_name, start, end):
+    """Variants on reference_name with a position in [start, end), in position order"""
+    chromosome = reference_name if reference_name.startswith('chr') else 'chr' + reference_name
+    return query.extra(
+        select={'position': '"{}"'.format(GA4GH_POSITION)},
+        where=['"{}" = %s'.format(GA4GH_CHROMOSOME), '"{0}" >= %s AND "{0}" < %s'.format(GA4GH_POSITION)],
+        params=[chromosome, start, end],
+        order_by=['position', 'id'])
 
-    filt = str(reference_name)+":"
-    DbResp = Variant.objects
-    DbResp = DbResp.filter(Genomic_Coordinate_hg37__startswith=filt)
-    ret_data = ga4gh_brca_page(DbResp, int(page_size), int(page_token))
-    ga_vars = [brca_to_ga4gh(i) for i in ret_data.values()]
-    if len(ga_vars) > page_size:
-        ga_vars.pop()
-        page_token = str(1 + int(page_token))
-    else:
-        response0.next_page_token = ""
-    response0.variants.extend(ga_vars)
-    response0.next_page_token = page_token
-    resp = json_format._MessageToJsonObject(response0, True)
-    return JsonResponse(resp)
 
-def ga4gh_brca_page(query, page_size, page_token):
-    start = page_size * page_token
-    end = start + page_size+1
-    return query[start:end]
+def page_key(page_token, reference_name):
+    """The (position, id) the page of page_token starts after, None for the first page"""
+    if not page_token or page_token == "0":
+        return None
+    reference, position, variant_id = decode_cursor(page_token)
+    if reference != reference_name:
+        raise ValueError(page_token)
+    return [int(position), int(variant_id)]
+
+
+def ga4gh_brca_page(query, page_size, after):
+    # an index seek to the first variant after the key on the (chromosome, position, id) index,
+    # plus one more row to tell whether there is a next page
+    if after:
+        query = query.extra(where=['("{}", id) > (%s, %s)'.format(GA4GH_POSITION)], params=after)
+    return query[:page_size + 1]
 
 def get_offset(start, end, VarLEn = None):
     if VarLEn:
@@ -230,6 +616,49 @@ def brca_to_ga4gh(brca_variant):
 
     return var_resp
 
+# The info key of every column that goes into a GA4GH variant's info map
+GA4GH_INFO_KEYS = [(column, str(column)) for column in VARIANT_FIELDS
+                   if column not in ('id', 'Genomic_Coordinate_hg37')]
+
+
+def ga4gh_json(brca_variant):
+    """The JSON of brca_to_ga4gh(brca_variant) with default values included, as json_format writes it
+    (64 bit integers as strings, info values as one element lists), built without protobuf messages"""
+    reference_name, start, bases = brca_variant['Genomic_Coordinate_hg37'].split(':')
+    reference_bases, alternate_bases = bases.split('>')
+    start = int(start)
+    return {
+        'id': str(brca_variant['id']),
+        'variantSetId': 'brca_exchange_hg37',
+        'names': ['This are names'],
+        'created': '0',
+        'updated': '0',
+        'referenceName': reference_name,
+        'start': str(start),
+        'end': str(start + len(alternate_bases)),
+        'referenceBases': reference_bases,
+        'alternateBases': list(alternate_bases),
+        'info': {key: [brca_variant[column]] for column, key in GA4GH_INFO_KEYS},
+        'calls': [],
+    }
+
+# Media types a GA4GH client can put in Accept to get the serialized protobuf message instead of its JSON
+PROTOBUF_TYPES = ('application/x-protobuf', 'application/protobuf')
+
+
+def protobuf_type(request):
+    """The protobuf media type the request accepts, None for JSON"""
+    for media_range in request.META.get('HTTP_ACCEPT', '').split(','):
+        media_type = media_range.split(';')[0].strip()
+        if media_type in PROTOBUF_TYPES:
+            return media_type
+    return None
+
+
+def protobuf_response(message, content_type):
+    return HttpResponse(message.SerializeToString(), content_type=content_type)
+
+
 def validate_request(request):
     if not request.body:
         return JsonResponse(ErrorMessages['emptyBody'])
@@ -253,9 +682,13 @@ ErrorMessages = {'emptyBody' :{'error code': 400, 'message' : 'invalid request e
                  'end' : {'error code' :400, 'message': 'invalid request no end'},
                  'datasetId': {'error code' : 400, 'message': 'invalid request no dataset_id'},
                  'variantId': {'error code' : 400, 'message': 'invalid request no variant_id'},
-                 'variantSetId': {'error code': 400, 'message': 'invalid request no variant_set_id'}}
+                 'variantSetId': {'error code': 400, 'message': 'invalid request no variant_set_id'},
+                 'pageToken': {'error code': 400, 'message': 'invalid request bad page_token'},
+                 'pageSize': {'error code': 400, 'message': 'invalid request page_size must be positive'}}
 
 @require_http_methods(["GET"])
+@vary_on_headers('Accept')
+@condition(etag_func=release_etag, last_modified_func=release_last_modified)
 def get_var_by_id(request, variant_id):
     if not variant_id:
         return JsonResponse(ErrorMessages['variantId'])
@@ -263,12 +696,13 @@ def get_var_by_id(request, variant_id):
         gen_coor_and_id = variant_id
         gen_coor, v_id = gen_coor_and_id.split("-")
 
-        DbResp = Variant.objects.values()
+        DbResp = Variant.objects.values(*VARIANT_FIELDS)
         resp1 = DbResp.get(id=int(v_id))
-        Var_resp = brca_to_ga4gh(resp1)
-        resp = json_format._MessageToJsonObject(Var_resp, True)
 
-        return JsonResponse(resp)
+        content_type = protobuf_type(request)
+        if content_type:
+            return protobuf_response(brca_to_ga4gh(resp1), content_type)
+        return JsonResponse(ga4gh_json(resp1))
 
 def validate_varsetreq(request):
     if not request.body:
@@ -281,6 +715,7 @@ def validate_varsetreq(request):
             return None
 
 @require_http_methods(["POST"])
+@vary_on_headers('Accept')
 def get_variantSet(request):
     condit = validate_varsetreq(request)
 
@@ -292,16 +727,21 @@ def get_variantSet(request):
         page_size = req_dict.get('pageSize', 3)
         page_token = req_dict.get('pageToken', '0')
 
+    content_type = protobuf_type(request)
+    if dataset_id in VARIANT_SETS:
+        # the prepared set and the page token, concatenated protobuf messages are read as one merged message
+        prepared = VARIANT_SETS[dataset_id]
+        if content_type:
+            token = v_s.SearchVariantSetsResponse(next_page_token=str(page_token)).SerializeToString()
+            return HttpResponse(prepared['search_protobuf'] + token, content_type=content_type)
+        return HttpResponse('{{"nextPageToken":{},"variantSets":[{}]}}'.format(
+            dumps(str(page_token)), prepared['search_json']), content_type='application/json')
+
     response1 = v_s.SearchVariantSetsResponse()
     response1.next_page_token = page_token
-    response = vrs.VariantSet()
-    response.id = datasetId+"-"+dataset_id
-    response.name = name+"-"+dataset_id
-    response.dataset_id =  name
-    response.reference_set_id = referenceSetId+"-"+dataset_id
-
-    brca_meta(response.metadata, dataset_id)
-    response1.variant_sets.extend([response])
+    response1.variant_sets.extend([variant_set(datasetId, dataset_id)])
+    if content_type:
+        return protobuf_response(response1, content_type)
     resp = json_format._MessageToJsonObject(response1, True)
     return JsonResponse(resp)
 
@@ -324,7 +764,37 @@ referenceSetId = "Genomic_Coordinate"
 name = "brca_exchange"
 SetIds = ["hg36", "hg37", "hg38"]
 
+
+def variant_set(dataset, set_id):
+    response = vrs.VariantSet()
+    response.id = dataset + "-" + set_id
+    response.name = name + "-" + set_id
+    response.dataset_id = name
+    response.reference_set_id = referenceSetId + "-" + set_id
+    brca_meta(response.metadata, set_id)
+    return response
+
+
+def prepare_variant_set(set_id):
+    """The response bodies of a variant set, they only depend on the model"""
+    message = variant_set(datasetId, set_id)
+    search = v_s.SearchVariantSetsResponse()
+    search.variant_sets.extend([message])
+    return {
+        'json': dumps(json_format._MessageToJsonObject(message, False)),
+        'protobuf': message.SerializeToString(),
+        # variantsets/search adds the page token to these
+        'search_json': dumps(json_format._MessageToJsonObject(message, True)),
+        'search_protobuf': search.SerializeToString(),
+    }
+
+
+# Built when the app is ready (see DataConfig.ready) and served from memory
+VARIANT_SETS = {set_id: prepare_variant_set(set_id) for set_id in SetIds}
+
 @require_http_methods(["GET"])
+@vary_on_headers('Accept')
+@condition(etag_func=release_etag, last_modified_func=release_last_modified)
 def get_varset_by_id(request, variantSetId):
 
     if not variantSetId :
@@ -332,12 +802,15 @@ def get_varset_by_id(request, variantSetId):
 
     dataset, Id = variantSetId.split("-")
     if Id in SetIds:
-        response = vrs.VariantSet()
-        response.id = dataset + "-" + Id
-        response.name = name + "-" + Id
-        response.dataset_id = name
-        response.reference_set_id = referenceSetId + "-" + Id
-        brca_meta(response.metadata, Id)
+        content_type = protobuf_type(request)
+        if dataset == datasetId:
+            prepared = VARIANT_SETS[Id]
+            if content_type:
+                return HttpResponse(prepared['protobuf'], content_type=content_type)
+            return HttpResponse(prepared['json'], content_type='application/json')
+        response = variant_set(dataset, Id)
+        if content_type:
+            return protobuf_response(response, content_type)
         resp = json_format._MessageToJsonObject(response, False)
         return JsonResponse(resp)
     else:
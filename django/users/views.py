@@ -8,7 +8,7 @@ from urllib2 import HTTPError
 import requests
 from django.core.mail import EmailMultiAlternatives
 from django.db import IntegrityError
-from django.http import JsonResponse
+from brca.serializers import JsonResponse, jsonable
 from django.template import Context
 from django.template.loader import get_template
 from django.utils import timezone
@@ -29,7 +29,7 @@ def retrieve(request):
     query = MyUser.objects.filter(email=user)
     data = list(query.values())[0]
     data["password"] = ''
-    response = JsonResponse({'user': data})
+    response = JsonResponse({'user': jsonable(data)})
     return response
 
 
@@ -254,5 +254,5 @@ def users(request):
         if user['hide_number']:
             user['phone_number'] = ""
 
-    response = JsonResponse({'data': data, 'count': count})
+    response = JsonResponse({'data': jsonable(data), 'count': count})
     return response
@@ -69,11 +69,30 @@ function users(opts) {
     return Rx.DOM.get(users_url).map(xhr => JSON.parse(xhr.responseText));
 }
 
+// The lollipop endpoint returns one array per column, turn them back into row objects.
 function lollipopData(opts) {
-    opts.pageLength = 0;
-    opts.format = 'json';
-    opts.column = ['id', 'Genomic_Coordinate_hg38', 'Pathogenicity_default'];
-    return Rx.DOM.get(url(opts)).map(xhr => JSON.parse(xhr.responseText));
+    var {
+        filterValues = {},
+        search = '',
+        include,
+        exclude
+        } = opts,
+
+        [filter, filterValue] = transpose(_.pairs(_.pick(filterValues, v => v)));
+    search = trimSearchTerm(search);
+
+    var lollipop_url = `${config.backend_url}/data/lollipop/?${qs.stringify(_.pick({
+        filter,
+        filterValue,
+        'search_term': search,
+        'include': include,
+        'exclude': exclude
+    }, v => v != null), {arrayFormat: 'repeat'})}`;
+    return Rx.DOM.get(lollipop_url).map(xhr => {
+        var columns = JSON.parse(xhr.responseText),
+            names = _.keys(columns);
+        return {data: _.map(transpose(_.values(columns)), row => _.object(names, row))};
+    });
 }
 
 module.exports = {